@@ -1,8 +1,14 @@
 import cv2
 import os
-import json
-import numpy as np
-import face_recognition
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+from utils.capture import ThreadedCapture
+from utils.face_detection import FaceLocator
+from utils.gallery import FaceGallery
+from utils.tracker import FaceTracker
+from utils.face_store import open_face_store
 
 FACES_DIR = "faces"
 
@@ -22,7 +28,7 @@ def register_face():
         print("❌ Invalid expiration date.")
         return
 
-    cap = cv2.VideoCapture(0)
+    cap = ThreadedCapture(0)
     print("📸 Please look at the camera... Press 'v' to capture your face.")
 
     while True:
@@ -35,26 +41,20 @@ def register_face():
 
         key = cv2.waitKey(1) & 0xFF
         if key == ord("v"):  # Capture the photo when 'v' is pressed
-            face_locations = face_recognition.face_locations(frame)
+            face_locations, face_encodings = FaceLocator().detect_and_encode(frame, max_faces=1)
             if not face_locations:
                 print("❌ No face detected.")
                 continue
 
-            face_encoding = face_recognition.face_encodings(frame, face_locations)[0]
-
-            data = {
-                "name": name,
-                "visa_number": visa_number,
-                "expiration_date": expiration_date,
-                "cvv": cvv,
-                "encoding": face_encoding.tolist()
-            }
+            face_encoding = face_encodings[0]
 
             if not os.path.exists(FACES_DIR):
                 os.makedirs(FACES_DIR)
 
-            with open(os.path.join(FACES_DIR, f"{name}.json"), "w") as f:
-                json.dump(data, f)
+            open_face_store(FACES_DIR).append(name, face_encoding,
+                                              visa_number=visa_number,
+                                              expiration_date=expiration_date,
+                                              cvv=cvv)
 
             cv2.imwrite(os.path.join(FACES_DIR, f"{name}.jpg"), frame)
 
@@ -74,37 +74,33 @@ def load_faces():
         print("⚠️ No registered data found.")
         return load_faces()
 
-    json_files = [f for f in os.listdir(FACES_DIR) if f.endswith(".json")]
-    if not json_files:
+    try:
+        store = open_face_store(FACES_DIR)
+    except Exception as e:
+        print(f"❌ Error loading face store: {e}")
+        return encodings, names, visas
+
+    if not len(store):
         print("⚠️ No registered data found.")
-        return load_faces()
+        return encodings, names, visas
 
-    for file in json_files:
-        try:
-            with open(os.path.join(FACES_DIR, file), "r") as f:
-                data = json.load(f)
-                if "encoding" not in data:
-                    print(f"⚠️ Skipping {file} (no encoding found)")
-                    continue
-                encodings.append(np.array(data["encoding"]))
-                names.append(data["name"])
-                visas[data["name"]] = {
-                    "visa_number": data["visa_number"],
-                    "expiration_date": data["expiration_date"],
-                    "cvv": data["cvv"]
-                }
-        except Exception as e:
-            print(f"❌ Error loading {file}: {e}")
-
-    if not encodings:
-        print("⚠️ No valid data found.")
-        return load_faces()
+    names = store.names
+    encodings = store.embeddings
+    for data in store.metadata():
+        visas[data["name"]] = {
+            "visa_number": data["visa_number"],
+            "expiration_date": data["expiration_date"],
+            "cvv": data["cvv"]
+        }
 
     return encodings, names, visas
 
 def recognize_faces():
     known_encodings, known_names, visa_data = load_faces()
-    cap = cv2.VideoCapture(0)
+    gallery = FaceGallery(known_names, known_encodings)
+    face_locator = FaceLocator()
+    tracker = FaceTracker()
+    cap = ThreadedCapture(0)
 
     print("🎥 Starting real-time face recognition. Press 'q' to quit, 'v' to capture a photo, or 'e' to register an unknown face.")
 
@@ -114,18 +110,24 @@ def recognize_faces():
             print("❌ Failed to capture image.")
             break
 
-        face_locations = face_recognition.face_locations(frame)
-        face_encodings = face_recognition.face_encodings(frame, face_locations)
+        rgb = face_locator.to_rgb(frame)
+        tracks = tracker.update(face_locator.locate(frame, rgb=rgb))
 
-        for (top, right, bottom, left), face_encoding in zip(face_locations, face_encodings):
-            matches = face_recognition.compare_faces(known_encodings, face_encoding)
-            name = "Unknown"
+        # Only encode new tracks, tracks due for re-verification and weakly tracked ones
+        stale = [track for track in tracks if tracker.needs_identity(track)]
+        if stale:
+            face_encodings = face_locator.encode(frame, [track.box for track in stale], rgb=rgb)
+            for track, match in zip(stale, gallery.match_many(face_encodings)):
+                if match.name is None and track.identity is None:
+                    print("❗ Unknown face detected.")
+                tracker.set_identity(track, match)
 
-            face_distances = face_recognition.face_distance(known_encodings, face_encoding)
-            best_match_index = np.argmin(face_distances) if len(face_distances) > 0 else None
+        for track in tracks:
+            top, right, bottom, left = track.box
+            name = "Unknown"
 
-            if best_match_index is not None and matches[best_match_index]:
-                name = known_names[best_match_index]
+            if track.name is not None:
+                name = track.name
                 visa_number = visa_data[name]["visa_number"]
                 masked_visa = "*" * 12 + visa_number[-4:]
 
@@ -133,11 +135,13 @@ def recognize_faces():
                 cv2.putText(frame, f"Visa: {masked_visa}", (left, bottom + 25), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
             else:
                 cv2.putText(frame, name, (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 255), 2)
-                print("❗ Unknown face detected.")
                 cv2.putText(frame, "Press 'e' to register", (left, bottom + 25), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
 
             cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0) if name != "Unknown" else (0, 0, 255), 2)
 
+        cv2.putText(frame, f"Detect: {face_locator.last_detect_seconds * 1000:.0f} ms | "
+                           f"Encoded: {len(stale)}/{len(tracks)}", (10, 25),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
         cv2.imshow("Face Recognition", frame)
 
         key = cv2.waitKey(1) & 0xFF
@@ -1,8 +1,13 @@
 import cv2
 import mediapipe as mp
 import math
+import sys
+from pathlib import Path
 
-cap = cv2.VideoCapture(0)
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+from utils.capture import ThreadedCapture
+
+cap = ThreadedCapture(0)
 
 mp_hands = mp.solutions.hands
 hands = mp_hands.Hands(max_num_hands=1)
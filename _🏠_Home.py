@@ -2,9 +2,23 @@ import streamlit as st
 from pathlib import Path
 import json
 from streamlit_lottie import st_lottie
+from utils.metrics import start_metrics_export
+from utils.models import get_antispoof_model
+from utils.service_client import get_service_client
+from utils.tts_cache import get_phrase_cache
 
 current_dir = Path(__file__).parent if "__file__" in locals() else Path.cwd()
 Login_Animation_file = current_dir / "assets" / "Home_Animation.json"
+model_path = str(current_dir / "assets" / "best.pt")
+
+# Start loading the anti-spoofing model now so it is warm by the time someone logs in;
+# with AUTH_SERVICE_URL set the service runs it instead
+if get_service_client() is None:
+    get_antispoof_model(model_path).warm_up_async()
+# Pre-synthesize the fixed voice prompts so they play instantly (and offline)
+get_phrase_cache().warm_async()
+# Periodically export login/sign-up metrics to metrics/auth.prom
+start_metrics_export()
 
 def load_lottiefile(filepath: str):
     with open(filepath, "r") as f:
@@ -1,24 +1,27 @@
 import streamlit as st
 import cv2
-import face_recognition
 import os
 import json
-import numpy as np
 from pathlib import Path
 from streamlit_lottie import st_lottie
 import time
 from datetime import datetime
 from cvzone.HandTrackingModule import HandDetector
-from cvzone.FaceDetectionModule import FaceDetector
-from ultralytics import YOLO
 import cvzone
-from gtts import gTTS
-from io import BytesIO
-import pygame
 import math
-
-# Initialize pygame mixer for audio
-pygame.mixer.init()
+from utils import metrics
+from utils.audio import PRIORITY_HIGH, PRIORITY_NORMAL, get_audio_prompter
+from utils.capture import ThreadedCapture
+from utils.face_detection import FaceLocator
+from utils.gallery import FaceGallery
+from utils.gallery_cache import get_gallery_cache
+from utils.image_writer import get_image_writer, screenshot_codec
+from utils.models import get_antispoof_model
+from utils.pipeline import FACE_AREA, HAND_AREA, build_auth_pipeline
+from utils.service_client import RemoteAntiSpoofModel, ServiceOverloaded, get_service_client
+from utils.thumbnails import get_thumbnail_cache
+from utils.user_index import get_user_index
+from utils.verification_log import get_verification_log
 
 # Create necessary directories
 current_dir = Path(__file__).parent if "__file__" in locals() else Path.cwd()
@@ -30,16 +33,10 @@ SCREENSHOTS_DIR = root_dir / "screenshots"
 FACES_DIR.mkdir(exist_ok=True)
 SCREENSHOTS_DIR.mkdir(exist_ok=True)
 
-def play_audio_message(text):
+def play_audio_message(text, priority=PRIORITY_NORMAL, interrupt=False):
+    # Queued on the audio worker thread; never blocks the camera loop
     try:
-        tts = gTTS(text=text, lang='en')
-        fp = BytesIO()
-        tts.write_to_fp(fp)
-        fp.seek(0)
-        pygame.mixer.music.load(fp)
-        pygame.mixer.music.play()
-        while pygame.mixer.music.get_busy():
-            pygame.time.Clock().tick(10)
+        get_audio_prompter().say(text, priority=priority, interrupt=interrupt)
     except Exception as e:
         st.error(f"Error in audio playback: {str(e)}")
 
@@ -110,6 +107,14 @@ current_dir = Path(__file__).parent if "__file__" in locals() else Path.cwd()
 Login_Animation_file = current_dir.parent / "assets" / "Login_Animation.json"
 model_path = str(current_dir.parent / "assets" / "best.pt")
 
+# With AUTH_SERVICE_URL set, recognition and anti-spoofing run on the shared service
+service = get_service_client()
+
+# Load and warm up the anti-spoofing model in the background as soon as the page opens
+if service is None:
+    get_antispoof_model(model_path).warm_up_async()
+metrics.start_metrics_export()
+
 ########################################################################################
 
 def load_lottiefile(filepath: str):
@@ -119,89 +124,108 @@ def load_lottiefile(filepath: str):
 ########################################################################################
 
 def load_registered_users():
-    users = {}
     try:
-        if FACES_DIR.exists():
-            for file in FACES_DIR.glob("*.json"):
-                with open(file, "r") as f:
-                    user_data = json.load(f)
-                    users[user_data['name']] = np.array(user_data['encoding'])
+        return get_gallery_cache(FACES_DIR).get()
     except Exception as e:
         st.error(f"Error loading registered users: {str(e)}")
-    return users
+    return FaceGallery()
 
 ########################################################################################
 
-def login_user(camera_index):
-    try:
-        cap = cv2.VideoCapture(camera_index)
-        if not cap.isOpened():
-            st.error("📷 Camera not found. Please check your camera connection.")
-            return None
+def create_login_pipeline(cap):
+    model = RemoteAntiSpoofModel(service) if service else get_antispoof_model(model_path)
+    return build_auth_pipeline(FaceLocator(), model,
+                               HandDetector(detectionCon=0.8, maxHands=1), load_registered_users,
+                               clock=cap.media_time)
+
+########################################################################################
+
+def identify_user(ctx):
+    """(outcome, name) for the frame in ``ctx``: no_face, multiple_faces, spoof, not_recognized or recognized"""
+    if service:
+        result = service.identify(ctx.frame, liveness=True)
+        if not result["faces"]:
+            return "no_face", None
+        if result["faces"] > 1:
+            return "multiple_faces", None
+        if not result["real"]:
+            return "spoof", None
+        return ("recognized", result["name"]) if result["name"] else ("not_recognized", None)
+
+    if ctx["encoding"] is None:
+        return "no_face", None
+    # Liveness needs the single MediaPipe face; a face only the dlib fallback found is not enough
+    faces = ctx["liveness"]["faces"]
+    if faces != 1:
+        return ("no_face" if not faces else "multiple_faces"), None
+    if not ctx["liveness"]["real"]:
+        return "spoof", None
+    match = ctx["match"]
+    return ("recognized", match.name) if match.name else ("not_recognized", None)
+
+########################################################################################
 
+def login_user(cap, pipeline):
+    pipeline.flow = "login"
+    try:
         st.info("🎥 Please face the camera and press 'L' to start recognition or 'Q' to quit.")
         play_audio_message("Please face the camera and press L to start recognition")
 
-        users = load_registered_users()
-        if not users:
+        registered = service.health()["users"] if service else len(load_registered_users())
+        if not registered:
             st.warning("⚠️ No registered users found. Please register first.")
             return None
 
-        model = YOLO(model_path)
-        classNames = ["fake", "real"]
-        confidence_threshold = 0.6
-
         while True:
+            frame_start = time.perf_counter()
             ret, frame = cap.read()
             if not ret:
                 st.error("📸 Failed to capture image.")
                 break
 
+            # Nothing is computed until a key press asks for it
+            ctx = pipeline.process(frame)
+
             # Add instructions overlay
-            cv2.putText(frame, "Press 'L' to Login | 'Q' to Quit", (20, 30),
+            display = frame.copy()
+            cv2.putText(display, "Press 'L' to Login | 'Q' to Quit", (20, 30),
                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
             
-            cv2.imshow("Login - Face Capture", frame)
+            metrics.frame_seconds.observe(time.perf_counter() - frame_start, flow="login")
+            cv2.imshow("Login - Face Capture", display)
 
             key = cv2.waitKey(1) & 0xFF
             if key == ord('q'):
                 break
 
             if key == ord('l'):
-                face_locations = face_recognition.face_locations(frame)
-                if not face_locations:
+                try:
+                    outcome, name = identify_user(ctx)
+                except ServiceOverloaded:
+                    st.warning("⏳ Verification service is busy. Please try again.")
+                    continue
+                metrics.outcomes.inc(flow="login", outcome=outcome)
+
+                if outcome == "no_face":
                     st.warning("👤 No face detected. Please try again.")
                     play_audio_message("No face detected. Please try again")
                     continue
 
-                face_encoding = face_recognition.face_encodings(frame, face_locations)[0]
-
-                spoof_results = model(frame, stream=True, verbose=False)
-                is_real = False
-
-                for result in spoof_results:
-                    for box in result.boxes:
-                        conf = float(box.conf[0])
-                        cls = int(box.cls[0])
-                        label = classNames[cls]
-                        if conf > confidence_threshold and label == "real":
-                            is_real = True
-                            break
+                if outcome == "multiple_faces":
+                    st.warning("👥 More than one face detected. Please make sure only you are in view.")
+                    play_audio_message("More than one face detected. Please make sure only you are in view")
+                    continue
 
-                if not is_real:
+                if outcome == "spoof":
                     st.error("🚫 Spoof detected! Please use your real face.")
                     play_audio_message("Spoof detected! Please use your real face")
                     continue
 
-                for name, encoding in users.items():
-                    matches = face_recognition.compare_faces([encoding], face_encoding)
-                    if any(matches):
-                        welcome_msg = f"Welcome back, {name.split(' ')[0]}!"
-                        st.success(f"✨ {welcome_msg}")
-                        play_audio_message(welcome_msg)
-                        cap.release()
-                        cv2.destroyAllWindows()
-                        return name
+                if outcome == "recognized":
+                    welcome_msg = f"Welcome back, {name.split(' ')[0]}!"
+                    st.success(f"✨ {welcome_msg}")
+                    play_audio_message(welcome_msg, priority=PRIORITY_HIGH)
+                    return name
 
                 st.error("❌ Face not recognized. Please register first.")
                 play_audio_message("Face not recognized. Please register first")
@@ -211,40 +235,51 @@ def login_user(camera_index):
         st.error(f"🚨 An error occurred: {str(e)}")
         return None
     finally:
-        if 'cap' in locals():
-            cap.release()
+        metrics.record_capture(cap, "login")
         cv2.destroyAllWindows()
 
     return None
 
 ########################################################################################
 
-def start_anti_spoofing_verification(user_name):
+def report_screenshot(future, verification_log, user_id, user_name, stage_ms, timeout=None):
+    """Report a background screenshot write and log the verification"""
     try:
-        hand_detector = HandDetector(detectionCon=0.8, maxHands=1)
-        face_detector = FaceDetector(minDetectionCon=0.7)
-        model = YOLO(model_path)
-        classNames = ["fake", "real"]
+        screenshot_path = future.result(timeout)
+        st.success(f"Screenshot saved to {screenshot_path}")
+    except Exception as e:
+        screenshot_path = None
+        st.error(f"Failed to save screenshot: {str(e)}")
+    verification_log.append(user_id, user_name, "success", stage_ms, screenshot_path)
+
+########################################################################################
 
+def start_anti_spoofing_verification(user_name, cap, pipeline):
+    pipeline.flow = "verification"
+    success_flag = False
+    logged_outcome = None
+    # Entries are keyed by user id; first names are not unique
+    user_id = get_user_index(FACES_DIR).user_id(user_name)
+    verification_log = get_verification_log(SCREENSHOTS_DIR)
+    # Screenshots are encoded and written off the frame loop
+    writer = get_image_writer()
+    codec = screenshot_codec()
+    pending_screenshots = []  # (future, stage_ms) still being written
+    try:
         # Ensure screenshots directory exists
         SCREENSHOTS_DIR.mkdir(exist_ok=True)
 
-        cap = cv2.VideoCapture(0)
-        cap.set(3, 640)
-        cap.set(4, 480)
-
         # Detection zones
-        face_area = (100, 100, 200, 200)
-        hand_area = (300, 100, 200, 200)
+        face_area = FACE_AREA
+        hand_area = HAND_AREA
 
         # Flags and timers
-        start_time = None
+        pipeline.reset()
         success_flag = False
         sound_played = False
         screenshot_taken = False
         greeting_played = False
         User_Name = user_name.split(" ")[0]
-        confidence = 0.6
 
         # FPS tracking
         prev_frame_time = 0
@@ -263,55 +298,33 @@ def start_anti_spoofing_verification(user_name):
                 break
                 
             img = cv2.flip(img, 1)
-            h, w, _ = img.shape
-
-            img, faces = face_detector.findFaces(img, draw=True)
-            face_inside = False
-            face_real = False
-
-            if faces and len(faces) == 1:
-                face = faces[0]
-                fx, fy = face["center"]
-                if face_area[0] < fx < face_area[0] + face_area[2] and face_area[1] < fy < face_area[1] + face_area[3]:
-                    face_inside = True
-
-                    # Run YOLO detection
-                    results = model(img, stream=True, verbose=False)
-                    for r in results:
-                        boxes = r.boxes
-                        for box in boxes:
-                            x1, y1, x2, y2 = box.xyxy[0]
-                            x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-                            w, h = x2 - x1, y2 - y1
-                            conf = math.ceil((box.conf[0] * 100)) / 100
-                            cls = int(box.cls[0])
-
-                            if conf > confidence:
-                                label = classNames[cls]
-                                color = (0, 255, 0) if label == "real" else (0, 0, 255)
-                                cvzone.cornerRect(img, (x1, y1, w, h), colorC=color, colorR=color)
-                                cvzone.putTextRect(img, f'{label.upper()} {int(conf*100)}%',
-                                                (max(0, x1), max(35, y1)), scale=2, thickness=4,
-                                                colorR=color, colorB=color)
-                                if label == 'real':
-                                    face_real = True
-
-            hands, img = hand_detector.findHands(img, flipType=False)
-            hand_inside = False
-            ok_sign = False
-
-            if hands:
-                hand = hands[0]
-                lmList = hand["lmList"]
-                cx, cy = hand["center"]
-                if hand_area[0] < cx < hand_area[0] + hand_area[2] and hand_area[1] < cy < hand_area[1] + hand_area[3]:
-                    hand_inside = True
-
-                thumb_tip = lmList[4][:2]
-                index_tip = lmList[8][:2]
-                dist = ((thumb_tip[0] - index_tip[0]) ** 2 + (thumb_tip[1] - index_tip[1]) ** 2) ** 0.5
-                if dist < 40:
-                    ok_sign = True
+
+            # Every stage runs at most once for this frame; overlays are drawn afterwards
+            ctx = pipeline.process(img, "hold")
+            hold = ctx["hold"]
+            gesture = ctx["gesture"]
+            face_inside = hold["face_inside"]
+            hand_inside = gesture["inside"]
+            ok_sign = gesture["ok_sign"]
+            success_flag = hold["success"]
+
+            for face in ctx["faces"]:
+                cvzone.cornerRect(img, face["bbox"])
+
+            if face_inside:
+                for detection in ctx["liveness"]["detections"]:
+                    x1, y1, x2, y2 = detection.box
+                    w, h = x2 - x1, y2 - y1
+                    conf = math.ceil((detection.confidence * 100)) / 100
+                    label = detection.label
+                    color = (0, 255, 0) if label == "real" else (0, 0, 255)
+                    cvzone.cornerRect(img, (x1, y1, w, h), colorC=color, colorR=color)
+                    cvzone.putTextRect(img, f'{label.upper()} {int(conf*100)}%',
+                                    (max(0, x1), max(35, y1)), scale=2, thickness=4,
+                                    colorR=color, colorB=color)
+
+            for hand in gesture["hands"]:
+                cvzone.cornerRect(img, hand["bbox"], colorC=(255, 0, 255), colorR=(255, 0, 255))
 
             # Show detection zone boxes with modern style
             cvzone.cornerRect(img, (face_area[0], face_area[1], face_area[2], face_area[3]),
@@ -330,35 +343,25 @@ def start_anti_spoofing_verification(user_name):
                              scale=2, thickness=2,
                              colorR=(0, 255, 0) if hand_inside and ok_sign else (0, 0, 255))
 
-            if face_inside and face_real and hand_inside and ok_sign and not success_flag:
-                if start_time is None:
-                    start_time = time.time()
-
-                elapsed = time.time() - start_time
-                remaining = int(5 - elapsed)
-                
-                if remaining > 0:
-                    cvzone.putTextRect(img, f"Hold steady: {remaining}s", (200, 400),
-                                     scale=2, thickness=3, colorR=(0, 255, 0))
-                elif not success_flag:
-                    success_flag = True
-            else:
-                if not success_flag:
-                    start_time = None
+            if hold["remaining"] is not None and hold["remaining"] > 0:
+                cvzone.putTextRect(img, f"Hold steady: {hold['remaining']}s", (200, 400),
+                                 scale=2, thickness=3, colorR=(0, 255, 0))
 
             if success_flag:
                 if not screenshot_taken:
+                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                    screenshot_path = SCREENSHOTS_DIR / f"{User_Name}_screenshot_{timestamp}.{codec.format}"
                     try:
-                        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                        screenshot_path = SCREENSHOTS_DIR / f"{User_Name}_screenshot_{timestamp}.png"
-                        cv2.imwrite(str(screenshot_path), img)
-                        screenshot_taken = True
-                        st.success(f"Screenshot saved to {screenshot_path}")
+                        future = writer.submit(screenshot_path, img, codec, after=get_thumbnail_cache().store)
+                        pending_screenshots.append((future, pipeline.stage_ms()))
                     except Exception as e:
                         st.error(f"Failed to save screenshot: {str(e)}")
+                        verification_log.append(user_id, user_name, "success", pipeline.stage_ms())
+                    screenshot_taken = True
+                    logged_outcome = "success"
 
                 if not sound_played:
-                    play_audio_message("Thank you for verifying your identity")
+                    play_audio_message("Thank you for verifying your identity", priority=PRIORITY_HIGH)
                     sound_played = True
 
                 cvzone.putTextRect(img, "Press R to reset or Q to quit", (180, 450),
@@ -367,29 +370,75 @@ def start_anti_spoofing_verification(user_name):
             # Calculate and display FPS
             fps = 1 / (new_frame_time - prev_frame_time)
             prev_frame_time = new_frame_time
-            cvzone.putTextRect(img, f"FPS: {int(fps)}", (20, 40),
+            cvzone.putTextRect(img, f"FPS: {int(fps)} | Camera: {int(cap.capture_fps)}", (20, 40),
                              scale=1.5, thickness=2)
+            rates = pipeline.scheduler.rates()
+            cvzone.putTextRect(img, f"YOLO {rates['antispoof']:.0f}Hz | Hand {rates['hands']:.0f}Hz",
+                             (20, 80), scale=1, thickness=1)
+
+            # Report screenshots the writer has finished with
+            for item in [item for item in pending_screenshots if item[0].done()]:
+                pending_screenshots.remove(item)
+                report_screenshot(item[0], verification_log, user_id, user_name, item[1])
 
+            metrics.frame_seconds.observe(time.time() - new_frame_time, flow="verification")
             cv2.imshow("Verification", img)
 
             key = cv2.waitKey(1)
             if key & 0xFF == ord('q'):
                 break
             elif key & 0xFF == ord('r'):
-                start_time = None
+                pipeline.reset()
                 success_flag = False
                 sound_played = False
                 screenshot_taken = False
                 greeting_played = True
-                play_audio_message("Resetting verification. Please start again.")
+                logged_outcome = None
+                play_audio_message("Resetting verification. Please start again.", interrupt=True)
 
     except Exception as e:
         st.error(f"🚨 An error occurred during verification: {str(e)}")
+        if logged_outcome is None:
+            verification_log.append(user_id, user_name, "error", pipeline.stage_ms())
+            logged_outcome = "error"
     finally:
-        if 'cap' in locals():
-            cap.release()
+        # The camera window stays open until the last screenshot is on disk
+        for future, stage_ms in pending_screenshots:
+            report_screenshot(future, verification_log, user_id, user_name, stage_ms, timeout=5.0)
+        if logged_outcome is None:
+            verification_log.append(user_id, user_name, "abandoned", pipeline.stage_ms())
+        metrics.record_capture(cap, "verification")
+        metrics.outcomes.inc(flow="verification", outcome="success" if success_flag else "abandoned")
         cv2.destroyAllWindows()
 
+    return success_flag
+
+########################################################################################
+
+def run_login(source):
+    """Identify and then verify the user in one camera session"""
+    # A camera index, video file, image folder or stream URL
+    cap = ThreadedCapture(source)
+    try:
+        if not cap.isOpened():
+            st.error("📷 Camera not found. Please check your camera connection.")
+            return None
+        cap.set(3, 640)
+        cap.set(4, 480)
+
+        pipeline = create_login_pipeline(cap)
+        user_name = login_user(cap, pipeline)
+        if user_name:
+            with st.spinner("🔍 Running security verification..."):
+                start_anti_spoofing_verification(user_name, cap, pipeline)
+
+        timings = " | ".join(f"{stage}: {ms:.1f} ms" for stage, ms in pipeline.stage_ms().items())
+        if timings:
+            st.caption(f"⏱️ Stage timings: {timings}")
+        return user_name
+    finally:
+        cap.release()
+
 ########################################################################################
 
 def main():
@@ -433,17 +482,16 @@ def main():
         cameras = [0, 1, 2, 3]
         camera_index = st.selectbox("Choose your camera", cameras, index=0,
                                   format_func=lambda x: f"Camera {x}")
+        source = st.text_input("🎞️ Or a video file, image folder or stream URL", "")
 
         if st.button("🔓 Login", key="login_button"):
             with st.spinner("🎥 Initializing face recognition..."):
-                user_name = login_user(camera_index)
+                user_name = run_login(source.strip() or camera_index)
                 if user_name:
-                    with st.spinner("🔍 Running security verification..."):
-                        start_anti_spoofing_verification(user_name)
-                        is_logged_in = True
-                        logged_in_user = user_name
-                        st.success(f"✅ Welcome, {user_name}! Login successful!")
-                        st.balloons()
+                    is_logged_in = True
+                    logged_in_user = user_name
+                    st.success(f"✅ Welcome, {user_name}! Login successful!")
+                    st.balloons()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,28 +1,25 @@
 import streamlit as st
 import cv2
-import face_recognition
-import os
 import json
-import numpy as np
 from pathlib import Path
 from streamlit_lottie import st_lottie
-from gtts import gTTS
-from io import BytesIO
-import pygame
+from utils import metrics
+from utils.audio import PRIORITY_HIGH, PRIORITY_NORMAL, get_audio_prompter
+from utils.capture import ThreadedCapture
+from utils.face_detection import FaceLocator
+from utils.gallery import FaceGallery
+from utils.gallery_cache import get_gallery_cache
+from utils.image_writer import FACE_CODEC, get_image_writer
+from utils.service_client import ServiceOverloaded, get_service_client
+from utils.thumbnails import FACE_THUMBNAIL_SIDE, get_thumbnail_cache
 
-# Initialize pygame mixer for audio
-pygame.mixer.init()
+# With AUTH_SERVICE_URL set, faces are encoded and enrolled by the shared service
+service = get_service_client()
 
-def play_audio_message(text):
+def play_audio_message(text, priority=PRIORITY_NORMAL, interrupt=False):
+    # Queued on the audio worker thread; never blocks the camera loop
     try:
-        tts = gTTS(text=text, lang='en')
-        fp = BytesIO()
-        tts.write_to_fp(fp)
-        fp.seek(0)
-        pygame.mixer.music.load(fp)
-        pygame.mixer.music.play()
-        while pygame.mixer.music.get_busy():
-            pygame.time.Clock().tick(10)
+        get_audio_prompter().say(text, priority=priority, interrupt=interrupt)
     except Exception as e:
         st.error(f"Error in audio playback: {str(e)}")
 
@@ -106,42 +103,90 @@ def load_lottiefile(filepath: str):
 ########################################################################################
 
 def load_registered_users():
-    users = {}
     try:
-        if os.path.exists(FACES_DIR):
-            for file in os.listdir(FACES_DIR):
-                if file.endswith(".json"):
-                    with open(os.path.join(FACES_DIR, file), "r") as f:
-                        user_data = json.load(f)
-                        users[user_data['name']] = np.array(user_data['encoding'])
+        return get_gallery_cache(FACES_DIR).get()
     except Exception as e:
         st.error(f"Error loading registered users: {str(e)}")
-    return users
+    return FaceGallery()
 
 ########################################################################################
 
 def is_face_registered(face_encoding):
     try:
-        registered_users = load_registered_users()
-        for user, encoding in registered_users.items():
-            matches = face_recognition.compare_faces([encoding], face_encoding)
-            if any(matches):
-                return True
+        with metrics.stage_seconds.time(flow="signup", stage="match"):
+            return load_registered_users().contains(face_encoding)
     except Exception as e:
         st.error(f"Error checking face registration: {str(e)}")
     return False
 
 ########################################################################################
 
-def register_user(camera_index, name, visa_number, expiration_month, expiration_year, cvv):
+def is_name_taken(name):
     try:
-        cap = cv2.VideoCapture(camera_index)
+        return get_gallery_cache(FACES_DIR).name_taken(name)
+    except Exception as e:
+        st.error(f"Error checking registered names: {str(e)}")
+    return False
+
+########################################################################################
+
+def register_with_service(frame, name, visa_number, expiration_date, cvv):
+    """Enroll through the verification service; False means try another frame"""
+    try:
+        outcome = service.enroll(frame, name, visa_number=visa_number,
+                                 expiration_date=expiration_date, cvv=cvv)["outcome"]
+    except ServiceOverloaded:
+        st.warning("⏳ Verification service is busy. Please try again.")
+        return False
+    except Exception as e:
+        metrics.outcomes.inc(flow="signup", outcome="failed")
+        st.error(f"Failed to save user data: {str(e)}")
+        return True
+    metrics.outcomes.inc(flow="signup", outcome=outcome)
+
+    if outcome == "no_face":
+        st.warning("👤 No face detected. Please try again.")
+        play_audio_message("No face detected. Please try again")
+        return False
+    if outcome == "duplicate":
+        st.error("⚠️ This face is already registered with another name.")
+        play_audio_message("This face is already registered with another name")
+        return True
+    if outcome == "name_taken":
+        st.error("⚠️ This name is already registered. Please use a different name.")
+        return True
+
+    success_msg = f"{name} has been registered successfully!"
+    st.success(f"✅ {success_msg}")
+    play_audio_message(success_msg, priority=PRIORITY_HIGH)
+    return True
+
+########################################################################################
+
+def discard_face_image(future):
+    """Undo a queued face image write whose registration failed"""
+    def remove(done):
+        if not done.cancelled() and done.exception() is None:
+            get_thumbnail_cache(FACE_THUMBNAIL_SIDE).discard(done.result())
+            done.result().unlink(missing_ok=True)
+    # Not written yet: just drop it; otherwise delete it once it is on disk
+    if not future.cancel():
+        future.add_done_callback(remove)
+
+########################################################################################
+
+def register_user(source, name, visa_number, expiration_month, expiration_year, cvv):
+    face_image = None  # Future of the face image written in the background
+    try:
+        # A camera index, video file, image folder or stream URL
+        cap = ThreadedCapture(source)
         if not cap.isOpened():
             st.error("📷 Camera not found. Please check your camera connection.")
             return
         
         st.info("🎥 Please look at the camera and press 'V' to capture your face.")
         play_audio_message("Please look at the camera and press V to capture your face")
+        face_locator = FaceLocator()
         
         while True:
             ret, frame = cap.read()
@@ -160,45 +205,58 @@ def register_user(camera_index, name, visa_number, expiration_month, expiration_
                 break
                 
             if key == ord('v'):
-                face_locations = face_recognition.face_locations(frame)
+                if service:
+                    if register_with_service(frame, name, visa_number,
+                                             f"{expiration_month}/{expiration_year}", cvv):
+                        break
+                    continue
+
+                with metrics.stage_seconds.time(flow="signup", stage="encoding"):
+                    face_locations, face_encodings = face_locator.detect_and_encode(frame, max_faces=1)
                 if not face_locations:
+                    metrics.outcomes.inc(flow="signup", outcome="no_face")
                     st.warning("👤 No face detected. Please try again.")
                     play_audio_message("No face detected. Please try again")
                     continue
                     
-                face_encoding = face_recognition.face_encodings(frame, face_locations)[0]
+                face_encoding = face_encodings[0]
 
                 if is_face_registered(face_encoding):
+                    metrics.outcomes.inc(flow="signup", outcome="duplicate")
                     st.error("⚠️ This face is already registered with another name.")
                     play_audio_message("This face is already registered with another name")
                     break
 
+                # Checked again here in case the name was registered while the camera was open
+                if is_name_taken(name):
+                    metrics.outcomes.inc(flow="signup", outcome="name_taken")
+                    st.error("⚠️ This name is already registered. Please use a different name.")
+                    break
+
                 try:
+                    # Queue the face image first: if the writer is full, nothing is saved
+                    image_path = FACES_DIR / f"{name}.jpg"
+                    face_image = get_image_writer().submit(
+                        image_path, frame, FACE_CODEC, after=get_thumbnail_cache(FACE_THUMBNAIL_SIDE).store)
+                    
                     # Save user data
                     expiration_date = f"{expiration_month}/{expiration_year}"
-                    user_data = {
-                        "name": name,
-                        "visa_number": visa_number,
-                        "expiration_date": expiration_date,
-                        "cvv": cvv,
-                        "encoding": face_encoding.tolist()
-                    }
-                    
-                    # Save JSON data
-                    json_path = FACES_DIR / f"{name}.json"
-                    with open(json_path, "w") as f:
-                        json.dump(user_data, f)
-                    
-                    # Save face image
-                    image_path = FACES_DIR / f"{name}.jpg"
-                    cv2.imwrite(str(image_path), frame)
+                    get_gallery_cache(FACES_DIR).append(name, face_encoding,
+                                                          visa_number=visa_number,
+                                                          expiration_date=expiration_date,
+                                                          cvv=cvv)
                     
+                    metrics.outcomes.inc(flow="signup", outcome="registered")
                     success_msg = f"{name} has been registered successfully!"
                     st.success(f"✅ {success_msg}")
                     st.success(f"Data saved to {FACES_DIR}")
-                    play_audio_message(success_msg)
+                    play_audio_message(success_msg, priority=PRIORITY_HIGH)
                     
                 except Exception as e:
+                    if face_image is not None:
+                        discard_face_image(face_image)
+                        face_image = None
+                    metrics.outcomes.inc(flow="signup", outcome="failed")
                     st.error(f"Failed to save user data: {str(e)}")
                 break
 
@@ -206,8 +264,15 @@ def register_user(camera_index, name, visa_number, expiration_month, expiration_
         st.error(f"🚨 An error occurred during registration: {str(e)}")
     finally:
         if 'cap' in locals():
+            metrics.record_capture(cap, "signup")
             cap.release()
         cv2.destroyAllWindows()
+        # Report the background write once the camera window is closed
+        if face_image is not None:
+            try:
+                face_image.result(timeout=5.0)
+            except Exception as e:
+                st.error(f"Failed to save face image: {str(e)}")
 
 ########################################################################################
 
@@ -257,6 +322,7 @@ def main():
         available_cameras = [0, 1, 2, 3]
         camera_index = st.selectbox("📷 Select Camera", available_cameras, index=0,
                                   format_func=lambda x: f"Camera {x}")
+        source = st.text_input("🎞️ Or a video file, image folder or stream URL", "")
 
         # Personal Information
         name = st.text_input("👤 Full Name (minimum 3 words)")
@@ -286,9 +352,11 @@ def main():
                 st.error("⚠️ Invalid year. Must be 2 digits.")
             elif len(cvv) != 3 or not cvv.isdigit():
                 st.error("⚠️ Invalid CVV. Must be 3 digits.")
+            elif not service and is_name_taken(name):
+                st.error("⚠️ This name is already registered. Please use a different name.")
             else:
                 with st.spinner("📸 Starting registration process..."):
-                    register_user(camera_index, name, visa_number, expiration_month, expiration_year, cvv)
+                    register_user(source.strip() or camera_index, name, visa_number, expiration_month, expiration_year, cvv)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
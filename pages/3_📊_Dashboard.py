@@ -1,6 +1,4 @@
 import streamlit as st
-import json
-import cv2
 import numpy as np
 from pathlib import Path
 import shutil
@@ -8,6 +6,11 @@ from datetime import datetime
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+from utils import metrics
+from utils.gallery_cache import get_gallery_cache
+from utils.thumbnails import FACE_THUMBNAIL_SIDE, get_thumbnail_cache
+from utils.user_index import get_user_index
+from utils.verification_log import get_verification_log
 
 # Set page config
 st.set_page_config(page_title="User Dashboard", layout="wide")
@@ -63,23 +66,36 @@ root_dir = current_dir.parent
 FACES_DIR = root_dir / "faces"
 SCREENSHOTS_DIR = root_dir / "screenshots"
 
-def load_user_data():
-    """Load all user data from json files"""
+# User list pagination
+PAGE_SIZES = [10, 25, 50, 100]
+DEFAULT_PAGE_SIZE = 25
+SORT_OPTIONS = {"Registration Date": "registered_at", "Name": "name"}
+
+def load_user_data(search="", order_by="registered_at", descending=True, limit=None, offset=0):
+    """Query one page of user rows from the SQLite user index"""
     users = []
     if FACES_DIR.exists():
-        for json_file in FACES_DIR.glob("*.json"):
-            with open(json_file, "r") as f:
-                user_data = json.load(f)
-                # Remove encoding from display data
-                display_data = {k: v for k, v in user_data.items() if k != 'encoding'}
-                display_data['registration_date'] = datetime.fromtimestamp(json_file.stat().st_ctime).strftime("%Y-%m-%d %H:%M:%S")
-                users.append(display_data)
+        for row in get_user_index(FACES_DIR).users(search, order_by, descending, limit, offset):
+            row['registration_date'] = datetime.fromtimestamp(row['registered_at']).strftime("%Y-%m-%d %H:%M:%S")
+            users.append(row)
     return users
 
-def delete_user(name):
+def load_export_data():
+    """Full user records (including card details) from the face store, for export only"""
+    export_data = []
+    for record in get_gallery_cache(FACES_DIR).metadata():
+        display_data = {k: v for k, v in record.items() if k not in ('id', 'registered_at')}
+        display_data['registration_date'] = datetime.fromtimestamp(record['registered_at']).strftime("%Y-%m-%d %H:%M:%S")
+        export_data.append(display_data)
+    return export_data
+
+def delete_user(name, user_id):
     """Delete user data and files"""
     try:
-        # Delete JSON file
+        # Remove from the face store
+        get_gallery_cache(FACES_DIR).remove(name)
+
+        # Delete legacy JSON file
         json_file = FACES_DIR / f"{name}.json"
         if json_file.exists():
             json_file.unlink()
@@ -87,11 +103,15 @@ def delete_user(name):
         # Delete image file
         img_file = FACES_DIR / f"{name}.jpg"
         if img_file.exists():
+            get_thumbnail_cache(FACE_THUMBNAIL_SIDE).discard(img_file)
             img_file.unlink()
             
-        # Delete related screenshots
-        for screenshot in SCREENSHOTS_DIR.glob(f"{name.split()[0]}_screenshot_*.png"):
-            screenshot.unlink()
+        # Delete the user's logged screenshots, then their log entries
+        verification_log = get_verification_log(SCREENSHOTS_DIR)
+        for screenshot in verification_log.screenshots(user_id):
+            get_thumbnail_cache().discard(screenshot)
+            screenshot.unlink(missing_ok=True)
+        verification_log.forget(user_id)
             
         st.success(f"Successfully deleted user: {name}")
         return True
@@ -99,7 +119,7 @@ def delete_user(name):
         st.error(f"Error deleting user: {str(e)}")
         return False
 
-def display_metrics(users):
+def display_metrics(index):
     """Display key metrics"""
     col1, col2, col3 = st.columns(3)
     
@@ -109,12 +129,11 @@ def display_metrics(users):
             <div class="metric-value">{}</div>
             <div class="metric-label">Total Users</div>
         </div>
-        """.format(len(users)), unsafe_allow_html=True)
+        """.format(index.count()), unsafe_allow_html=True)
         
     with col2:
-        today = datetime.now().date()
-        today_users = sum(1 for user in users 
-                         if datetime.strptime(user['registration_date'], "%Y-%m-%d %H:%M:%S").date() == today)
+        midnight = datetime.combine(datetime.now().date(), datetime.min.time())
+        today_users = index.count_registered_since(midnight.timestamp())
         st.markdown("""
         <div class="metric-card">
             <div class="metric-value">{}</div>
@@ -123,26 +142,24 @@ def display_metrics(users):
         """.format(today_users), unsafe_allow_html=True)
         
     with col3:
-        screenshots = len(list(SCREENSHOTS_DIR.glob("*.png")))
+        verifications = get_verification_log(SCREENSHOTS_DIR).count("success")
         st.markdown("""
         <div class="metric-card">
             <div class="metric-value">{}</div>
             <div class="metric-label">Total Verifications</div>
         </div>
-        """.format(screenshots), unsafe_allow_html=True)
+        """.format(verifications), unsafe_allow_html=True)
 
-def display_charts(users):
+def display_charts(index):
     """Display analytics charts"""
-    if not users:
+    if not index.count():
         return
     
     col1, col2 = st.columns(2)
     
     with col1:
-        # Registration timeline
-        df = pd.DataFrame(users)
-        df['registration_date'] = pd.to_datetime(df['registration_date'])
-        df_daily = df.groupby(df['registration_date'].dt.date).size().reset_index(name='count')
+        # Registration timeline, aggregated in SQLite
+        df_daily = pd.DataFrame(index.daily_registrations(), columns=['registration_date', 'count'])
         
         fig = px.line(df_daily, x='registration_date', y='count',
                      title='User Registrations Over Time',
@@ -150,81 +167,159 @@ def display_charts(users):
         st.plotly_chart(fig, use_container_width=True)
     
     with col2:
-        # Card expiration analysis
-        df['expiration_date'] = pd.to_datetime(df['expiration_date'].apply(lambda x: f"20{x.split('/')[1]}-{x.split('/')[0]}-01"))
-        months_to_expire = ((df['expiration_date'] - pd.Timestamp.now()).dt.days / 30).round()
+        # Card expiration analysis (users without a card on file are skipped)
+        df_expiry = pd.DataFrame(index.expiry_months(), columns=['expires_on', 'count'])
+        now = datetime.now()
+        df_expiry['months'] = df_expiry['expires_on'].apply(
+            lambda x: int(x[:4]) * 12 + int(x[5:7]) - (now.year * 12 + now.month))
         
-        fig = px.histogram(x=months_to_expire, nbins=20,
+        fig = px.histogram(df_expiry, x='months', y='count', histfunc='sum', nbins=20,
                           title='Card Expiration Distribution',
-                          labels={'x': 'Months until expiration', 'y': 'Number of cards'})
+                          labels={'months': 'Months until expiration', 'count': 'Number of cards'})
+        st.plotly_chart(fig, use_container_width=True)
+
+def display_performance():
+    """Counters and per-stage latency from the shared metrics registry"""
+    flows = ["login", "verification", "signup"]
+    counters = [("Frames Processed", metrics.frames_processed),
+                ("Frames Dropped", metrics.frames_dropped),
+                ("Spoof Rejections", metrics.spoof_rejections),
+                ("Recognition Misses", metrics.recognition_misses)]
+    for col, (label, counter) in zip(st.columns(len(counters)), counters):
+        col.metric(label, int(counter.total()),
+                   help=" | ".join(f"{flow}: {int(counter.value(flow=flow))}" for flow in flows))
+
+    rows = []
+    for flow, stage in sorted(metrics.stage_seconds.values):
+        labels = {"flow": flow, "stage": stage}
+        rows.append({"flow": flow, "stage": stage,
+                     "calls": metrics.stage_seconds.count(**labels),
+                     "mean_ms": 1000 * metrics.stage_seconds.mean(**labels),
+                     "p50_ms": 1000 * metrics.stage_seconds.quantile(0.5, **labels),
+                     "p95_ms": 1000 * metrics.stage_seconds.quantile(0.95, **labels)})
+    for flow in flows:
+        if metrics.frame_seconds.count(flow=flow):
+            rows.append({"flow": flow, "stage": "whole frame",
+                         "calls": metrics.frame_seconds.count(flow=flow),
+                         "mean_ms": 1000 * metrics.frame_seconds.mean(flow=flow),
+                         "p50_ms": 1000 * metrics.frame_seconds.quantile(0.5, flow=flow),
+                         "p95_ms": 1000 * metrics.frame_seconds.quantile(0.95, flow=flow)})
+    if not rows:
+        st.info("No login or sign-up activity recorded since the app started")
+        return
+
+    df = pd.DataFrame(rows)
+    col1, col2 = st.columns(2)
+    with col1:
+        fig = px.bar(df[df['stage'] != 'whole frame'], x='stage', y='mean_ms', color='flow', barmode='group',
+                     title='Mean Stage Latency', labels={'mean_ms': 'Milliseconds', 'stage': 'Stage'})
         st.plotly_chart(fig, use_container_width=True)
+    with col2:
+        # p50/p95 are histogram bucket upper bounds
+        st.dataframe(df.round(2), use_container_width=True, hide_index=True)
+    st.download_button("📄 Download Prometheus metrics", metrics.get_metrics().render(),
+                       file_name="auth.prom", mime="text/plain")
 
 def main():
     st.title("👥 User Management Dashboard")
     
-    # Load user data
-    users = load_user_data()
+    # Counts and charts are queried from the user index
+    index = get_user_index(FACES_DIR)
     
     # Display metrics
-    display_metrics(users)
+    display_metrics(index)
     
     # Display charts
     st.markdown("### 📊 Analytics")
-    display_charts(users)
+    display_charts(index)
+
+    # Hot-path performance
+    st.markdown("### ⚙️ Performance")
+    display_performance()
     
     # User management section
     st.markdown("### 👤 User Management")
     
     # Search functionality
     search_term = st.text_input("🔍 Search users by name", "").lower()
-    filtered_users = [user for user in users if search_term in user['name'].lower().replace(" ", "")]
+    
+    # Sorting and page size
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        sort_label = st.selectbox("Sort by", list(SORT_OPTIONS))
+    with col2:
+        descending = st.selectbox("Order", ["Descending", "Ascending"],
+                                  index=0 if sort_label != "Name" else 1) == "Descending"
+    with col3:
+        page_size = st.selectbox("Users per page", PAGE_SIZES, index=PAGE_SIZES.index(DEFAULT_PAGE_SIZE))
+    
+    # Total count comes from the index; only the visible page is loaded
+    total_users = index.count(search_term)
+    page_count = max(1, -(-total_users // page_size))
+    
+    # Go back to the first page whenever the query changes
+    query = (search_term, sort_label, descending, page_size)
+    if st.session_state.get('user_query') != query:
+        st.session_state['user_query'] = query
+        st.session_state['user_page'] = 1
+    st.session_state['user_page'] = min(st.session_state.get('user_page', 1), page_count)
     
     # Add a message to show search results count
     if search_term:
-        st.write(f"Found {len(filtered_users)} matching users")
+        st.write(f"Found {total_users} matching users")
+    
+    page = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, key='user_page')
+    page_users = load_user_data(search_term, SORT_OPTIONS[sort_label], descending,
+                                limit=page_size, offset=(page - 1) * page_size)
+    if page_users:
+        first = (page - 1) * page_size + 1
+        st.caption(f"Showing users {first}-{first + len(page_users) - 1} of {total_users}")
     
-    # Display users
-    for user in filtered_users:
+    # Display users of the current page; face thumbnails are only read for these
+    for user in page_users:
         with st.container():
             st.markdown(f"""
             <div class="user-card">
                 <h3>{user['name']}</h3>
                 <p>Registration Date: {user['registration_date']}</p>
-                <p>Card Expiration: {user['expiration_date']}</p>
+                <p>Card Expiration: {user['expiration_date'] or ''}</p>
             </div>
             """, unsafe_allow_html=True)
             
             col1, col2, col3 = st.columns([1, 1, 2])
             
             with col1:
-                if st.button("🗑️ Delete", key=f"delete_{user['name']}"):
-                    if delete_user(user['name']):
+                if st.button("🗑️ Delete", key=f"delete_{user['id']}"):
+                    if delete_user(user['name'], user['id']):
                         st.rerun()
             
             with col2:
-                if st.button("🔄 View Activity", key=f"activity_{user['name']}"):
-                    screenshots = list(SCREENSHOTS_DIR.glob(f"{user['name'].split()[0]}_screenshot_*.png"))
-                    if screenshots:
+                if st.button("🔄 View Activity", key=f"activity_{user['id']}"):
+                    verification_log = get_verification_log(SCREENSHOTS_DIR)
+                    entries = verification_log.recent(user['id'], 5)
+                    if entries:
                         st.markdown("#### Recent Verifications")
-                        for screenshot in sorted(screenshots, key=lambda x: x.stat().st_mtime, reverse=True)[:5]:
-                            img = cv2.imread(str(screenshot))
-                            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                            st.image(img, caption=f"Verification on {datetime.fromtimestamp(screenshot.stat().st_mtime).strftime('%Y-%m-%d %H:%M:%S')}")
+                        for entry in entries:
+                            when = datetime.fromtimestamp(entry['timestamp']).strftime('%Y-%m-%d %H:%M:%S')
+                            screenshot = verification_log.screenshot_path(entry)
+                            # Cached JPEG bytes go to the browser as-is
+                            thumbnail = get_thumbnail_cache().thumbnail(screenshot) if screenshot else None
+                            if thumbnail:
+                                st.image(thumbnail, caption=f"Verification on {when}")
+                            else:
+                                st.caption(f"{entry['outcome'].capitalize()} verification on {when}")
                     else:
                         st.info("No verification history found")
             
             with col3:
                 # Display face image if available
-                face_img_path = FACES_DIR / f"{user['name']}.jpg"
-                if face_img_path.exists():
-                    img = cv2.imread(str(face_img_path))
-                    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                    st.image(img, caption="Registered Face", width=200)
+                thumbnail = get_thumbnail_cache(FACE_THUMBNAIL_SIDE).thumbnail(FACES_DIR / user['image'])
+                if thumbnail:
+                    st.image(thumbnail, caption="Registered Face", width=FACE_THUMBNAIL_SIDE)
     
     # Export functionality
     if st.button("📥 Export User Data"):
-        export_data = [{k: v for k, v in user.items() if k != 'encoding'} for user in users]
-        df = pd.DataFrame(export_data)
+        df = pd.DataFrame(load_export_data())
         csv = df.to_csv(index=False)
         st.download_button(
             label="📄 Download CSV",
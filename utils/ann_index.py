@@ -0,0 +1,210 @@
+"""Approximate nearest-neighbour search for large face galleries.
+
+``IVFIndex`` is an inverted-file index: a k-means coarse quantizer splits the
+gallery into ``nlist`` cells and a query only scans the ``nprobe`` cells whose
+centroids are closest. The shortlist is then re-ranked with exact distances, so
+the accept/reject decision still uses the same 0.6 tolerance as
+``face_recognition.compare_faces``. ``nprobe`` is the recall/latency knob.
+
+Both ``IVFIndex`` and the brute-force ``FaceGallery`` expose ``match``,
+``match_many``, ``contains``, ``add`` and ``remove``, so callers can swap one
+for the other through ``build_index``. ``remove`` only masks rows out.
+
+Training the quantizer is the slow part of a build. With ``centroids_path``
+the trained centroids are saved and reused by later builds until the
+gallery outgrows them, so a rebuild only re-assigns rows to cells.
+"""
+import os
+from pathlib import Path
+
+import numpy as np
+
+from utils.gallery import DEFAULT_TOLERANCE, FaceGallery, GalleryMatch
+
+# Below this many users a brute-force scan is already faster than probing
+ANN_MIN_SIZE = 20000
+DEFAULT_NPROBE = 8
+_TRAIN_SAMPLE = 65536
+_CHUNK = 16384
+
+
+def _sq_dists(a, b, b_sq=None):
+    if b_sq is None:
+        b_sq = np.einsum("ij,ij->i", b, b)
+    sq = np.einsum("ij,ij->i", a, a)[:, None] + b_sq[None, :] - 2.0 * a @ b.T
+    return np.maximum(sq, 0.0)
+
+
+def _assign(vectors, centroids, centroid_sq):
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), _CHUNK):
+        chunk = vectors[start:start + _CHUNK]
+        labels[start:start + _CHUNK] = _sq_dists(chunk, centroids, centroid_sq).argmin(axis=1)
+    return labels
+
+
+def train_kmeans(vectors, nlist, iterations=10, seed=0):
+    """Plain Lloyd k-means on a random sample; returns (nlist, dim) centroids."""
+    rng = np.random.default_rng(seed)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if len(vectors) > _TRAIN_SAMPLE:
+        vectors = vectors[rng.choice(len(vectors), _TRAIN_SAMPLE, replace=False)]
+    nlist = min(nlist, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        labels = _assign(vectors, centroids, np.einsum("ij,ij->i", centroids, centroids))
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        counts = np.bincount(labels, minlength=nlist)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # Re-seed empty cells from random points so every list stays useful
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+    return centroids
+
+
+def load_centroids(path, nlist, dim):
+    """Saved centroids if they fit a gallery wanting ``nlist`` cells, else None."""
+    try:
+        centroids = np.load(path)
+    except (OSError, ValueError):
+        return None
+    # Retrain once the gallery has grown or shrunk well past what they were trained for
+    if centroids.ndim != 2 or centroids.shape[1] != dim or not nlist / 2 <= len(centroids) <= 2 * nlist:
+        return None
+    return centroids.astype(np.float32)
+
+
+def save_centroids(path, centroids):
+    path = Path(path)
+    tmp = path.with_name(f"{path.stem}.tmp.npy")
+    np.save(tmp, centroids)
+    os.replace(tmp, path)
+
+
+class IVFIndex:
+    def __init__(self, centroids, nprobe=DEFAULT_NPROBE):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self._centroid_sq = np.einsum("ij,ij->i", self.centroids, self.centroids)
+        self.nprobe = nprobe
+        self.names = []
+        self._data = np.empty((0, self.centroids.shape[1]), dtype=np.float32)
+        self._data_sq = np.empty(0, dtype=np.float32)
+        self._size = 0
+        self._alive = np.empty(0, dtype=bool)
+        self.removed = 0
+        self._lists = [[] for _ in range(len(self.centroids))]
+        self._list_arrays = [None] * len(self.centroids)
+
+    @classmethod
+    def build(cls, names, encodings, nlist=None, nprobe=DEFAULT_NPROBE, centroids_path=None):
+        encodings = np.asarray(encodings, dtype=np.float32)
+        if nlist is None:
+            nlist = max(1, int(4 * np.sqrt(len(encodings))))
+        centroids = load_centroids(centroids_path, nlist, encodings.shape[1]) if centroids_path else None
+        if centroids is None:
+            centroids = train_kmeans(encodings, nlist)
+            if centroids_path:
+                save_centroids(centroids_path, centroids)
+        index = cls(centroids, nprobe=nprobe)
+        index.add_many(names, encodings)
+        return index
+
+    def __len__(self):
+        return self._size - self.removed
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    def _reserve(self, extra):
+        needed = self._size + extra
+        if needed <= len(self._data):
+            return
+        capacity = max(needed, 2 * len(self._data), 1024)
+        data = np.empty((capacity, self._data.shape[1]), dtype=np.float32)
+        data[:self._size] = self._data[:self._size]
+        data_sq = np.empty(capacity, dtype=np.float32)
+        data_sq[:self._size] = self._data_sq[:self._size]
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self._size] = self._alive[:self._size]
+        self._data, self._data_sq, self._alive = data, data_sq, alive
+
+    def add_many(self, names, encodings):
+        encodings = np.atleast_2d(np.asarray(encodings, dtype=np.float32))
+        names = list(names)
+        if not len(names):
+            return
+        self._reserve(len(names))
+        start = self._size
+        self._data[start:start + len(names)] = encodings
+        self._data_sq[start:start + len(names)] = np.einsum("ij,ij->i", encodings, encodings)
+        self._alive[start:start + len(names)] = True
+        self._size += len(names)
+        self.names.extend(names)
+        labels = _assign(encodings, self.centroids, self._centroid_sq)
+        for offset, label in enumerate(labels):
+            self._lists[label].append(start + offset)
+            self._list_arrays[label] = None
+
+    def add(self, name, encoding):
+        """Incremental insert: the new row joins its nearest existing cell."""
+        self.add_many([name], [encoding])
+
+    def remove(self, name):
+        """Mask out every live row registered as ``name``; returns how many."""
+        rows = [i for i, n in enumerate(self.names) if n == name and self._alive[i]]
+        self._alive[rows] = False
+        self.removed += len(rows)
+        return len(rows)
+
+    def _list_array(self, label):
+        if self._list_arrays[label] is None:
+            self._list_arrays[label] = np.asarray(self._lists[label], dtype=np.int64)
+        return self._list_arrays[label]
+
+    def shortlist(self, encoding, nprobe=None):
+        """Row ids stored in the ``nprobe`` cells closest to ``encoding``."""
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        probe = np.asarray(encoding, dtype=np.float32).reshape(1, -1)
+        cell_dists = _sq_dists(probe, self.centroids, self._centroid_sq)[0]
+        cells = np.argpartition(cell_dists, nprobe - 1)[:nprobe]
+        ids = np.concatenate([self._list_array(c) for c in cells])
+        return ids[self._alive[ids]] if self.removed else ids
+
+    def match(self, encoding, tolerance=DEFAULT_TOLERANCE, top_k=1, nprobe=None):
+        if not len(self):
+            return GalleryMatch(None, None, [])
+        ids = self.shortlist(encoding, nprobe)
+        if not len(ids):
+            return GalleryMatch(None, None, [])
+        probe = np.asarray(encoding, dtype=np.float32).reshape(1, -1)
+        # Exact re-rank of the shortlist
+        dists = np.sqrt(_sq_dists(probe, self._data[ids], self._data_sq[ids])[0])
+        k = min(max(top_k, 1), len(ids))
+        order = np.argpartition(dists, k - 1)[:k]
+        order = order[np.argsort(dists[order])]
+        candidates = [(self.names[ids[i]], float(dists[i])) for i in order]
+        best_name, best_dist = candidates[0]
+        return GalleryMatch(best_name if best_dist <= tolerance else None, best_dist, candidates)
+
+    def match_many(self, encodings, tolerance=DEFAULT_TOLERANCE, top_k=1, nprobe=None):
+        return [self.match(e, tolerance, top_k, nprobe) for e in encodings]
+
+    def contains(self, encoding, tolerance=DEFAULT_TOLERANCE):
+        return self.match(encoding, tolerance=tolerance).name is not None
+
+
+INDEX_TYPES = {
+    "exact": lambda names, encodings, **kw: FaceGallery(names, encodings),
+    "ivf": IVFIndex.build,
+}
+
+
+def build_index(names, encodings, kind="auto", **kwargs):
+    """Build a gallery index; ``auto`` only switches to IVF for large galleries."""
+    if kind == "auto":
+        kind = "ivf" if len(names) >= ANN_MIN_SIZE else "exact"
+    return INDEX_TYPES[kind](names, encodings, **kwargs)
@@ -0,0 +1,195 @@
+"""Export the anti-spoofing model to faster CPU runtimes and check the result.
+
+    python -m utils.antispoof_export export --formats onnx openvino --int8 --calibration samples/faces
+    python -m utils.antispoof_export check samples/faces --backend onnx-int8
+
+``export`` writes next to ``assets/best.pt``:
+
+- ``best.onnx`` (ONNX Runtime),
+- ``best_openvino_model/`` (OpenVINO),
+- ``best_int8.onnx`` with ``--int8``: ONNX Runtime static INT8
+  quantization, calibrated on the given sample frames.
+
+The exports use the face-ROI input size with dynamic shapes, so micro-batches
+and the full-frame path also work. ``check`` runs the original PyTorch model
+and an export on the same sample images. It reports how often the
+"fake"/"real" verdict and top label agree, the confidence drift and the
+speedup. It exits non-zero when agreement is below ``--min-agreement``.
+
+Select the backend at runtime with ``ANTISPOOF_BACKEND`` (see ``utils.models``).
+Needs ``pip install onnx onnxruntime`` (and ``openvino`` for that format).
+"""
+import argparse
+import json
+import math
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from utils.models import BACKENDS, ROI_INPUT_SIZE, AntiSpoofModel, resolve_model_path
+from utils.pipeline import SPOOF_CONFIDENCE
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_MODEL = ROOT_DIR / "assets" / "best.pt"
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+DEFAULT_MIN_AGREEMENT = 0.98
+MAX_CALIBRATION_IMAGES = 200
+
+
+def load_samples(directory, limit=None, input_size=ROI_INPUT_SIZE):
+    """Sample images resized so the longer side is ``input_size``, as the face-ROI path feeds them."""
+    samples = []
+    for path in sorted(Path(directory).rglob("*")):
+        if path.suffix.lower() not in IMAGE_EXTENSIONS:
+            continue
+        image = cv2.imread(str(path))
+        if image is None:
+            continue
+        scale = input_size / max(image.shape[:2])
+        samples.append(cv2.resize(image, (max(1, round(image.shape[1] * scale)),
+                                          max(1, round(image.shape[0] * scale))),
+                                  interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR))
+        if limit and len(samples) >= limit:
+            break
+    return samples
+
+
+def letterbox(image, size=ROI_INPUT_SIZE):
+    """NCHW float32 input the way ultralytics preprocesses a single image."""
+    h, w = image.shape[:2]
+    scale = min(size / h, size / w)
+    resized = cv2.resize(image, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_LINEAR)
+    canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+    top, left = (size - resized.shape[0]) // 2, (size - resized.shape[1]) // 2
+    canvas[top:top + resized.shape[0], left:left + resized.shape[1]] = resized
+    return np.ascontiguousarray(canvas[:, :, ::-1].transpose(2, 0, 1)[None], dtype=np.float32) / 255.0
+
+
+def quantize_int8(onnx_path, output_path, calibration, input_size=ROI_INPUT_SIZE):
+    """Static INT8 (QDQ) quantization of ``onnx_path`` calibrated on ``calibration`` images."""
+    import onnxruntime
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    input_name = onnxruntime.InferenceSession(str(onnx_path), providers=["CPUExecutionProvider"]) \
+        .get_inputs()[0].name
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self.batches = iter({input_name: letterbox(image, input_size)} for image in calibration)
+
+        def get_next(self):
+            return next(self.batches, None)
+
+    quantize_static(str(onnx_path), str(output_path), Reader(), quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8, per_channel=True)
+    return Path(output_path)
+
+
+def export(model_path=DEFAULT_MODEL, formats=("onnx",), int8=False, calibration_dir=None,
+           input_size=ROI_INPUT_SIZE):
+    """Write the requested exports next to ``model_path``; returns {backend: path}."""
+    from ultralytics import YOLO
+
+    model_path = Path(model_path)
+    written = {}
+    formats = set(formats) | ({"onnx"} if int8 else set())
+    for fmt in sorted(formats):
+        path = YOLO(str(model_path)).export(format=fmt, imgsz=input_size, dynamic=True)
+        written[fmt] = Path(path)
+        print(f"Exported {fmt}: {path}")
+    if int8:
+        if not calibration_dir:
+            raise ValueError("--int8 needs --calibration sample frames")
+        calibration = load_samples(calibration_dir, MAX_CALIBRATION_IMAGES, input_size)
+        if not calibration:
+            raise ValueError(f"No calibration images found in {calibration_dir}")
+        output = model_path.with_name(BACKENDS["onnx-int8"].format(stem=model_path.stem))
+        written["onnx-int8"] = quantize_int8(written["onnx"], output, calibration, input_size)
+        print(f"Quantized INT8 with {len(calibration)} calibration images: {output}")
+    return written
+
+
+def _verdict(detections):
+    detections = [d for d in detections if math.ceil(d.confidence * 100) / 100 > SPOOF_CONFIDENCE]
+    top = max(detections, key=lambda d: d.confidence, default=None)
+    return any(d.label == "real" for d in detections), top
+
+
+def _timed_detections(model, samples, input_size):
+    model.warm_up()
+    out, elapsed = [], 0.0
+    for image in samples:
+        start = time.perf_counter()
+        out.append(model.detect(image, imgsz=input_size))
+        elapsed += time.perf_counter() - start
+    return out, 1000 * elapsed / max(1, len(samples))
+
+
+def check(samples, backend, model_path=DEFAULT_MODEL, input_size=ROI_INPUT_SIZE):
+    """Compare ``backend`` against the PyTorch weights on ``samples``."""
+    candidate_path = resolve_model_path(model_path, backend)
+    if candidate_path == str(model_path):
+        raise FileNotFoundError(f"No {backend} export for {model_path}; run the export command first")
+    reference, reference_ms = _timed_detections(AntiSpoofModel(model_path), samples, input_size)
+    candidate, candidate_ms = _timed_detections(AntiSpoofModel(candidate_path), samples, input_size)
+
+    verdicts = labels = 0
+    drift = []
+    for ref, cand in zip(reference, candidate):
+        ref_real, ref_top = _verdict(ref)
+        cand_real, cand_top = _verdict(cand)
+        verdicts += ref_real == cand_real
+        labels += (ref_top and ref_top.label) == (cand_top and cand_top.label)
+        if ref_top and cand_top:
+            drift.append(abs(ref_top.confidence - cand_top.confidence))
+    n = max(1, len(samples))
+    return {
+        "backend": backend,
+        "model": candidate_path,
+        "samples": len(samples),
+        "verdict_agreement": verdicts / n,
+        "top_label_agreement": labels / n,
+        "mean_confidence_drift": float(np.mean(drift)) if drift else None,
+        "reference_ms": reference_ms,
+        "candidate_ms": candidate_ms,
+        "speedup": reference_ms / candidate_ms if candidate_ms else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export and check CPU backends for the anti-spoof model.")
+    parser.add_argument("--model", default=str(DEFAULT_MODEL), help="PyTorch .pt weights")
+    parser.add_argument("--imgsz", type=int, default=ROI_INPUT_SIZE)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="write ONNX/OpenVINO/INT8 exports")
+    export_parser.add_argument("--formats", nargs="+", default=["onnx"], choices=["onnx", "openvino"])
+    export_parser.add_argument("--int8", action="store_true", help="also write a calibrated INT8 ONNX model")
+    export_parser.add_argument("--calibration", help="directory of sample face frames for INT8 calibration")
+
+    check_parser = commands.add_parser("check", help="compare an export with the original outputs")
+    check_parser.add_argument("samples", help="directory of labelled or unlabelled face frames")
+    check_parser.add_argument("--backend", default="onnx", choices=[b for b in BACKENDS if b != "pytorch"])
+    check_parser.add_argument("--min-agreement", type=float, default=DEFAULT_MIN_AGREEMENT)
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        export(args.model, args.formats, args.int8, args.calibration, args.imgsz)
+        return 0
+
+    samples = load_samples(args.samples, input_size=args.imgsz)
+    if not samples:
+        parser.error(f"no images found in {args.samples}")
+    report = check(samples, args.backend, args.model, args.imgsz)
+    print(json.dumps(report, indent=2))
+    if report["verdict_agreement"] < args.min_agreement:
+        print(f"FAIL: verdict agreement {report['verdict_agreement']:.3f} < {args.min_agreement}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""Non-blocking spoken prompts.
+
+``play_audio_message`` used to synthesize and play speech inline and
+busy-wait until it finished, freezing the camera loop for the whole
+sentence. ``AudioPrompter`` moves that onto a worker thread fed by a
+priority queue:
+
+- identical prompts already queued or playing are coalesced,
+- prompts older than ``max_age`` when their turn comes are dropped,
+- a higher-priority prompt (or ``interrupt=True``) stops the one playing,
+- ``cancel`` removes pending prompts.
+
+The worker never touches Streamlit; failures are printed and kept in
+``last_error``.
+"""
+import heapq
+import itertools
+import threading
+import time
+
+import pygame
+
+from utils.tts_cache import get_phrase_cache
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+DEFAULT_MAX_AGE = 4.0
+
+
+class _Prompt:
+    def __init__(self, text, priority, max_age):
+        self.text = text
+        self.priority = priority
+        self.max_age = max_age
+        self.created = time.monotonic()
+
+    @property
+    def stale(self):
+        return self.max_age is not None and time.monotonic() - self.created > self.max_age
+
+
+class AudioPrompter:
+    def __init__(self, synthesize=None, max_age=DEFAULT_MAX_AGE):
+        # synthesize(text) -> list of pygame Sounds played back to back
+        self.synthesize = synthesize or (lambda text: get_phrase_cache().clips(text))
+        self.max_age = max_age
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._current = None
+        self._stop_current = False
+        self._thread = None
+        self.played = 0
+        self.coalesced = 0
+        self.dropped_stale = 0
+        self.cancelled = 0
+        self.interrupted = 0
+        self.last_error = None
+
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._worker, name="audio-prompts", daemon=True)
+            self._thread.start()
+
+    def say(self, text, priority=PRIORITY_NORMAL, max_age=None, interrupt=False):
+        """Queue ``text`` and return immediately; False if it was coalesced."""
+        with self._cond:
+            if interrupt:
+                self._cancel_pending()
+            else:
+                if self._current is not None and self._current.text == text:
+                    self.coalesced += 1
+                    return False
+                for i, (prio, _, prompt) in enumerate(self._heap):
+                    if prompt.text == text:
+                        if priority < prio:
+                            self._heap[i] = (priority, self._heap[i][1], prompt)
+                            prompt.priority = priority
+                            heapq.heapify(self._heap)
+                        self.coalesced += 1
+                        return False
+            prompt = _Prompt(text, priority, self.max_age if max_age is None else max_age)
+            heapq.heappush(self._heap, (priority, next(self._seq), prompt))
+            if self._current is not None and (interrupt or priority < self._current.priority):
+                self._stop_current = True
+            self._ensure_worker()
+            self._cond.notify_all()
+        return True
+
+    def _cancel_pending(self, text=None):
+        kept = [item for item in self._heap if text is not None and item[2].text != text]
+        self.cancelled += len(self._heap) - len(kept)
+        self._heap = kept
+        heapq.heapify(self._heap)
+
+    def cancel(self, text=None, stop_current=False):
+        """Drop pending prompts (only those matching ``text`` if given)."""
+        with self._cond:
+            self._cancel_pending(text)
+            if stop_current and self._current is not None:
+                self._stop_current = True
+
+    @property
+    def busy(self):
+        with self._cond:
+            return self._current is not None or bool(self._heap)
+
+    def wait_idle(self, timeout=None):
+        """Block until everything queued has played (for scripts, not the camera loop)."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._current is None and not self._heap, timeout)
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._heap)
+                _, _, prompt = heapq.heappop(self._heap)
+                if prompt.stale:
+                    self.dropped_stale += 1
+                    self._cond.notify_all()
+                    continue
+                self._current = prompt
+                self._stop_current = False
+            try:
+                self._play(prompt)
+            except Exception as e:
+                self.last_error = e
+                print(f"Error in audio playback: {e}")
+            finally:
+                with self._cond:
+                    self._current = None
+                    self._cond.notify_all()
+
+    def _play(self, prompt):
+        clips = self.synthesize(prompt.text)
+        if not pygame.mixer.get_init():
+            pygame.mixer.init()
+        channel = pygame.mixer.Channel(0)
+        for clip in clips:
+            channel.play(clip)
+            while channel.get_busy():
+                if self._stop_current:
+                    channel.stop()
+                    self.interrupted += 1
+                    return
+                time.sleep(0.02)
+        self.played += 1
+
+    def stats(self):
+        return {
+            "played": self.played,
+            "coalesced": self.coalesced,
+            "dropped_stale": self.dropped_stale,
+            "cancelled": self.cancelled,
+            "interrupted": self.interrupted,
+        }
+
+
+_prompter = None
+_prompter_lock = threading.Lock()
+
+
+def get_audio_prompter():
+    """The process-wide AudioPrompter."""
+    global _prompter
+    with _prompter_lock:
+        if _prompter is None:
+            _prompter = AudioPrompter()
+        return _prompter
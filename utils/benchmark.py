@@ -0,0 +1,280 @@
+"""Offline benchmark of the authentication hot path.
+
+    python -m utils.benchmark --images samples/faces --videos samples/clips
+    python -m utils.benchmark --images samples/faces --compare benchmark_results/<older>.json
+
+Runs the real Login-page stages over still images and recorded clips with no
+camera, display or key presses. Each stage reports:
+
+- p50/p95/p99 latency,
+- throughput,
+- model load time,
+- RSS after the stage.
+
+The peak RSS of the whole run is reported once, next to the stages.
+
+The stages are face location (MediaPipe and dlib HOG), face encoding,
+gallery matching (exact and IVF, at several gallery sizes), YOLO
+anti-spoof (full frame and face ROI), MediaPipe hand landmarks and OK-sign
+detection. Results are written as JSON under ``benchmark_results/`` so runs
+can be compared over time. Stages whose dependency or model is missing are
+reported with an ``error`` instead of aborting the run.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from utils.capture import ThreadedCapture
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_MODEL = ROOT_DIR / "assets" / "best.pt"
+DEFAULT_OUTPUT_DIR = ROOT_DIR / "benchmark_results"
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+VIDEO_EXTENSIONS = {".mp4", ".avi", ".mov", ".mkv", ".webm"}
+GALLERY_SIZES = (1000, 10000, 100000)
+
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return None
+
+
+def peak_rss_mb():
+    """Highest RSS of the process so far, or None where ``resource`` is unavailable."""
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux (bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+def summarize(samples):
+    """Latency percentiles (ms) and throughput for a list of durations in seconds."""
+    if not samples:
+        return {"count": 0}
+    ms = np.asarray(samples) * 1000
+    return {
+        "count": len(samples),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "throughput_per_s": float(len(samples) / (ms.sum() / 1000)) if ms.sum() else None,
+    }
+
+
+def load_frames(images=None, videos=None, max_video_frames=300, size=(640, 480)):
+    """BGR frames from an image directory and from every clip in a video directory."""
+    frames = []
+    if images:
+        for path in sorted(Path(images).rglob("*")):
+            if path.suffix.lower() in IMAGE_EXTENSIONS:
+                image = cv2.imread(str(path))
+                if image is not None:
+                    frames.append(cv2.resize(image, size) if size else image)
+    if videos:
+        for path in sorted(Path(videos).rglob("*")):
+            if path.suffix.lower() not in VIDEO_EXTENSIONS:
+                continue
+            cap = ThreadedCapture(str(path))
+            try:
+                for _ in range(max_video_frames):
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    frames.append(cv2.resize(frame, size) if size else frame)
+            finally:
+                cap.release()
+    return frames
+
+
+class Benchmark:
+    def __init__(self, warmup=3):
+        self.warmup = warmup
+        self.results = {}
+        self.outputs = {}
+
+    def stage(self, name, setup, run, inputs):
+        """Time ``setup()`` once as the load time, then ``run(state, x)`` for every input.
+
+        The return values of the timed runs (not the warm-up ones) are kept in
+        ``outputs[name]`` for later stages.
+        """
+        entry = {}
+        outputs = self.outputs[name] = []
+        try:
+            start = time.perf_counter()
+            state = setup()
+            entry["load_seconds"] = time.perf_counter() - start
+            inputs = list(inputs)
+            for x in inputs[:self.warmup]:
+                run(state, x)
+            samples = []
+            for x in inputs:
+                start = time.perf_counter()
+                output = run(state, x)
+                samples.append(time.perf_counter() - start)
+                outputs.append(output)
+            entry.update(summarize(samples))
+        except Exception as e:
+            entry["error"] = f"{type(e).__name__}: {e}"
+        entry["rss_mb"] = current_rss_mb()
+        self.results[name] = entry
+        status = entry.get("error") or (f"p50 {entry.get('p50_ms', 0):.2f} ms, "
+                                        f"p95 {entry.get('p95_ms', 0):.2f} ms")
+        print(f"{name:28s} {status}")
+        return entry
+
+
+def run_benchmark(frames, model_path=DEFAULT_MODEL, gallery_sizes=GALLERY_SIZES, queries=200,
+                  antispoof_backend=None):
+    bench = Benchmark()
+    if not frames:
+        raise ValueError("no frames to benchmark; pass --images and/or --videos")
+
+    def locator(model):
+        def setup():
+            from utils.face_detection import FaceLocator
+            return FaceLocator(model=model, fallback=None)
+        return setup
+
+    bench.stage("face_location_mediapipe", locator("mediapipe"), lambda loc, f: loc.locate(f), frames)
+    bench.stage("face_location_hog", locator("hog"), lambda loc, f: loc.locate(f), frames)
+
+    # Encode the faces found by the default detector
+    located = []
+    try:
+        from utils.face_detection import FaceLocator
+        loc = FaceLocator()
+        located = [(f, boxes[:1]) for f in frames for boxes in [loc.locate(f)] if boxes]
+    except Exception as e:
+        print(f"Skipping encoding inputs: {e}")
+    bench.stage("face_encoding", locator("mediapipe"), lambda loc, item: loc.encode(item[0], item[1])[0],
+                located)
+    encodings = bench.outputs["face_encoding"]
+
+    rng = np.random.default_rng(0)
+    probes = [e for e in encodings[:queries]] or list(rng.normal(0, 0.1, (queries, 128)))
+    for size in gallery_sizes:
+        def gallery_setup(kind, size=size):
+            from utils.ann_index import build_index
+            base = rng.normal(0, 0.1, (size, 128)).astype(np.float32)
+            return build_index([str(i) for i in range(size)], base, kind=kind)
+        for kind in ("exact", "ivf"):
+            bench.stage(f"gallery_match_{kind}_{size}", lambda k=kind: gallery_setup(k),
+                        lambda index, probe: index.match(probe), probes)
+
+    def antispoof_setup():
+        from utils.models import AntiSpoofModel, resolve_model_path
+        if not Path(model_path).exists():
+            raise FileNotFoundError(model_path)
+        return AntiSpoofModel(resolve_model_path(model_path, antispoof_backend)).warm_up()
+
+    bench.stage("antispoof_full_frame", antispoof_setup, lambda m, f: m.detect(f), frames)
+    face_boxes = [(f, (left, top, right - left, bottom - top))
+                  for f, [(top, right, bottom, left)] in located]
+    bench.stage("antispoof_face_roi", antispoof_setup,
+                lambda m, item: m.detect_face(item[0], item[1]), face_boxes)
+
+    def hands_setup():
+        from cvzone.HandTrackingModule import HandDetector
+        return HandDetector(detectionCon=0.8, maxHands=1)
+
+    def find_hands(detector, frame):
+        found = detector.findHands(frame, draw=False, flipType=False)
+        hands = found[0] if isinstance(found, tuple) else found
+        return hands[:1]
+
+    bench.stage("hand_landmarks", hands_setup, find_hands, frames)
+    hands_found = [hand for hands in bench.outputs["hand_landmarks"] for hand in hands]
+
+    def ok_sign_setup():
+        from utils.pipeline import is_ok_sign
+        return is_ok_sign
+
+    bench.stage("ok_sign", ok_sign_setup, lambda check, hand: check(hand), hands_found)
+    return bench.results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(current, previous):
+    """Print the p50/p95 change of every stage present in both runs."""
+    print(f"\n{'stage':28s} {'p50 ms':>18s} {'p95 ms':>18s}")
+    for name, entry in current["stages"].items():
+        old = previous.get("stages", {}).get(name)
+        if not old or "p50_ms" not in old or "p50_ms" not in entry:
+            continue
+        cells = []
+        for key in ("p50_ms", "p95_ms"):
+            change = (entry[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            cells.append(f"{old[key]:7.2f}->{entry[key]:7.2f} {change:+5.0f}%")
+        print(f"{name:28s} {cells[0]:>18s} {cells[1]:>18s}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the authentication hot path offline.")
+    parser.add_argument("--images", help="directory of face images")
+    parser.add_argument("--videos", help="directory of recorded clips")
+    parser.add_argument("--model", default=str(DEFAULT_MODEL), help="anti-spoof YOLO weights")
+    parser.add_argument("--antispoof-backend", help="pytorch, onnx, onnx-int8 or openvino "
+                                                    "(default: ANTISPOOF_BACKEND)")
+    parser.add_argument("--gallery-sizes", type=int, nargs="+", default=list(GALLERY_SIZES))
+    parser.add_argument("--max-video-frames", type=int, default=300)
+    parser.add_argument("--output", help="result JSON path (default: benchmark_results/<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier result JSON to compare against")
+    args = parser.parse_args(argv)
+
+    frames = load_frames(args.images, args.videos, args.max_video_frames)
+    print(f"Benchmarking on {len(frames)} frames")
+    stages = run_benchmark(frames, args.model, args.gallery_sizes, antispoof_backend=args.antispoof_backend)
+    result = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "frames": len(frames),
+        "antispoof_backend": args.antispoof_backend or os.environ.get("ANTISPOOF_BACKEND", "pytorch"),
+        # Process-wide high-water mark, so only meaningful for the run as a whole
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": stages,
+    }
+    output = Path(args.output) if args.output else \
+        DEFAULT_OUTPUT_DIR / f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(result, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
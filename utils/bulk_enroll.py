@@ -0,0 +1,214 @@
+"""Bulk enrollment from a directory of ID photos or a CSV manifest.
+
+    python -m utils.bulk_enroll photos/ [--workers 8] [--batch-size 64]
+    python -m utils.bulk_enroll manifest.csv
+
+A manifest has a ``path`` column, an optional ``name`` column and any of
+``visa_number``, ``expiration_date`` and ``cvv``. Paths are relative to the
+manifest. Without a manifest, every image under the directory is enrolled
+under its file name ("Jane_Doe_Smith.jpg" -> "Jane Doe Smith").
+
+Faces are detected and encoded in a process pool. Images with no face or
+with several faces are rejected. Each accepted face is checked against the
+gallery and the rest of its batch with one vectorized match. Accepted users
+are committed to the face store one batch at a time with
+``FaceStore.append_many``. Every finished image is recorded in a journal
+next to the store, so an interrupted run picks up where it stopped.
+"""
+import argparse
+import csv
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import cv2
+
+from utils.face_detection import FaceLocator
+from utils.face_store import FaceStore
+from utils.gallery import DEFAULT_TOLERANCE, FaceGallery
+from utils.gallery_cache import get_gallery_cache
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+DEFAULT_FACES_DIR = Path(__file__).resolve().parent.parent / "faces"
+JOURNAL_FILE = "bulk_enroll_journal.jsonl"
+# ID photos are often several megapixels; detect on at most this many pixels per side
+MAX_DETECTION_SIDE = 800
+
+_locator = None
+
+
+def _image_key(path):
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+
+def collect_jobs(source):
+    """(path, name, metadata) for every image in a directory or manifest."""
+    source = Path(source)
+    jobs = []
+    if source.is_dir():
+        for path in sorted(p for p in source.rglob("*") if p.suffix.lower() in IMAGE_EXTENSIONS):
+            jobs.append((str(path), path.stem.replace("_", " ").strip(), {}))
+    else:
+        with open(source, newline="") as f:
+            for row in csv.DictReader(f):
+                path = source.parent / row.pop("path")
+                name = (row.pop("name", "") or path.stem.replace("_", " ")).strip()
+                metadata = {k: v for k, v in row.items() if k in ("visa_number", "expiration_date", "cvv")}
+                jobs.append((str(path), name, metadata))
+    return jobs
+
+
+def encode_image(path, model="hog"):
+    """Worker: (status, encoding) for one image, run inside the process pool."""
+    global _locator
+    if _locator is None:
+        _locator = FaceLocator(model=model, fallback=None)
+    image = cv2.imread(path)
+    if image is None:
+        return "unreadable", None
+    _locator.scale = min(1.0, MAX_DETECTION_SIDE / max(image.shape[:2]))
+    rgb = _locator.to_rgb(image)
+    locations = _locator.locate(image, rgb=rgb)
+    if not locations:
+        return "no_face", None
+    if len(locations) > 1:
+        return "multiple_faces", None
+    # Only an accepted image's single face is encoded
+    return "ok", _locator.encode(image, locations, rgb=rgb)[0].tolist()
+
+
+class BulkEnroller:
+    def __init__(self, faces_dir=DEFAULT_FACES_DIR, workers=None, batch_size=64,
+                 tolerance=DEFAULT_TOLERANCE, model="hog", journal=None):
+        self.faces_dir = Path(faces_dir)
+        self.workers = workers or os.cpu_count()
+        self.batch_size = batch_size
+        self.tolerance = tolerance
+        self.model = model
+        self.journal_path = Path(journal) if journal else self.faces_dir / JOURNAL_FILE
+        self.cache = get_gallery_cache(self.faces_dir)
+        self.counts = {}
+
+    def _finished_keys(self):
+        done = set()
+        if self.journal_path.exists():
+            with open(self.journal_path, "r") as f:
+                for line in f:
+                    try:
+                        done.add(json.loads(line)["key"])
+                    except (ValueError, KeyError):
+                        continue
+        return done
+
+    def _commit(self, batch):
+        """Dedup a batch of encoded images and commit the accepted ones."""
+        gallery = self.cache.get()
+        known_names = set(self.cache.store.names)
+        encoded = [item for item in batch if item["status"] == "ok"]
+        matches = gallery.match_many([item["encoding"] for item in encoded],
+                                     tolerance=self.tolerance) if encoded and len(gallery) else []
+        accepted = FaceGallery()
+        for item, match in zip(encoded, matches or [None] * len(encoded)):
+            if match is not None and match.name is not None:
+                # Re-running over an image that was committed before the journal write
+                item["status"] = "already_enrolled" if match.name == item["name"] else "duplicate"
+                item["match"] = match.name
+            elif item["name"] in known_names:
+                item["status"] = "name_taken"
+            elif len(accepted) and accepted.contains(item["encoding"], self.tolerance):
+                item["status"] = "duplicate_in_batch"
+            else:
+                accepted.add(item["name"], item["encoding"])
+                known_names.add(item["name"])
+                item["status"] = "enrolled"
+
+        enrolled = [item for item in batch if item["status"] == "enrolled"]
+        for item in enrolled:
+            image_path = self.faces_dir / f"{item['name']}.jpg"
+            if Path(item["path"]).suffix.lower() in (".jpg", ".jpeg"):
+                shutil.copyfile(item["path"], image_path)
+            else:
+                cv2.imwrite(str(image_path), cv2.imread(item["path"]))
+        FaceStore(self.faces_dir).append_many(
+            (item["name"], item["encoding"],
+             {"visa_number": "", "expiration_date": "", "cvv": "", **item["metadata"]})
+            for item in enrolled)
+
+        # Journal only after the store commit
+        with open(self.journal_path, "a") as f:
+            for item in batch:
+                entry = {"key": item["key"], "path": item["path"], "name": item["name"],
+                         "status": item["status"]}
+                if "match" in item:
+                    entry["match"] = item["match"]
+                f.write(json.dumps(entry) + "\n")
+        for item in batch:
+            self.counts[item["status"]] = self.counts.get(item["status"], 0) + 1
+
+    def run(self, source, progress=print):
+        self.faces_dir.mkdir(parents=True, exist_ok=True)
+        self.cache.get()  # migrates legacy JSON users before the first commit
+        finished = self._finished_keys()
+        jobs = []
+        for path, name, metadata in collect_jobs(source):
+            try:
+                key = _image_key(path)
+            except OSError:
+                self.counts["missing"] = self.counts.get("missing", 0) + 1
+                continue
+            if key in finished:
+                self.counts["skipped"] = self.counts.get("skipped", 0) + 1
+                continue
+            jobs.append({"path": path, "name": name, "metadata": metadata, "key": key})
+
+        total = len(jobs)
+        progress(f"{total} images to enroll ({self.counts.get('skipped', 0)} already done)")
+        start = time.perf_counter()
+        done = 0
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            results = pool.map(encode_image, [job["path"] for job in jobs],
+                               [self.model] * total, chunksize=4)
+            batch = []
+            for job, (status, encoding) in zip(jobs, results):
+                batch.append(dict(job, status=status, encoding=encoding))
+                if len(batch) >= self.batch_size:
+                    self._commit(batch)
+                    done += len(batch)
+                    batch = []
+                    elapsed = time.perf_counter() - start
+                    progress(f"{done}/{total} images, {done / elapsed:.1f} img/s, "
+                             f"{self.counts.get('enrolled', 0)} enrolled")
+            if batch:
+                self._commit(batch)
+                done += len(batch)
+        elapsed = time.perf_counter() - start
+        progress(f"Done: {done} images in {elapsed:.1f}s "
+                 f"({done / elapsed if elapsed else 0:.1f} img/s) {self.counts}")
+        return self.counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Enroll users in bulk from ID photos.")
+    parser.add_argument("source", help="directory of images or a CSV manifest")
+    parser.add_argument("--faces-dir", default=str(DEFAULT_FACES_DIR))
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--model", choices=["hog", "cnn"], default="hog")
+    parser.add_argument("--journal", default=None,
+                        help=f"progress journal (default: <faces-dir>/{JOURNAL_FILE})")
+    args = parser.parse_args(argv)
+
+    enroller = BulkEnroller(args.faces_dir, workers=args.workers, batch_size=args.batch_size,
+                            tolerance=args.tolerance, model=args.model, journal=args.journal)
+    enroller.run(args.source)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
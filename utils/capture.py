@@ -0,0 +1,156 @@
+"""Background-thread camera capture that always hands out the newest frame.
+
+``ThreadedCapture`` is a drop-in replacement for ``cv2.VideoCapture``: it
+supports ``isOpened``, ``read``, ``get``, ``set`` and ``release``. A reader
+thread keeps a small ring buffer. When the processing loop falls behind,
+the oldest unread frames are dropped and counted, so the loop never works
+on a stale frame backlog.
+
+The source can be anything ``utils.frame_sources.open_reader`` accepts: a
+camera index, a video file, an image directory or a stream URL. Cameras and
+streams are live and drop frames. Recorded sources are read without
+dropping by default; the reader then waits for the consumer, so headless
+runs over a recording see every frame.
+"""
+import threading
+import time
+from collections import deque
+
+import cv2
+
+from utils.frame_sources import DEFAULT_SEQUENCE_FPS, is_live, open_reader
+
+
+class _Rate:
+    def __init__(self, window=2.0):
+        self.window = window
+        self._times = deque()
+
+    def mark(self):
+        now = time.monotonic()
+        self._times.append(now)
+        while now - self._times[0] > self.window:
+            self._times.popleft()
+
+    @property
+    def hz(self):
+        if len(self._times) < 2 or self._times[-1] == self._times[0]:
+            return 0.0
+        return (len(self._times) - 1) / (self._times[-1] - self._times[0])
+
+
+class ThreadedCapture:
+    def __init__(self, source=0, buffer_size=2, drop_frames=None, read_timeout=2.0):
+        self.source = source
+        self.live = is_live(source)
+        self.drop_frames = self.live if drop_frames is None else drop_frames
+        self.read_timeout = read_timeout
+        self.frames_captured = 0
+        self.frames_dropped = 0
+        self.frames_read = 0
+        self._capture_rate = _Rate()
+        self._processing_rate = _Rate()
+        self._buffer = deque(maxlen=max(1, buffer_size))
+        self._cond = threading.Condition()
+        self._device_lock = threading.Lock()
+        self._ended = False
+        self._stopped = False
+        self._cap = open_reader(source)
+        self._fps = self._cap.get(cv2.CAP_PROP_FPS) or DEFAULT_SEQUENCE_FPS
+        self._thread = None
+        if self._cap.isOpened():
+            self._thread = threading.Thread(target=self._reader, name="camera-capture", daemon=True)
+            self._thread.start()
+
+    def _reader(self):
+        while not self._stopped:
+            with self._device_lock:
+                ret, frame = self._cap.read()
+            if not ret:
+                break
+            with self._cond:
+                if not self.drop_frames:
+                    while len(self._buffer) == self._buffer.maxlen and not self._stopped:
+                        self._cond.wait(0.1)
+                elif len(self._buffer) == self._buffer.maxlen:
+                    self.frames_dropped += 1
+                self._buffer.append(frame)
+                self.frames_captured += 1
+                self._capture_rate.mark()
+                self._cond.notify_all()
+        with self._cond:
+            self._ended = True
+            self._cond.notify_all()
+
+    def isOpened(self):
+        return self._cap.isOpened() and not (self._ended and not self._buffer)
+
+    def read(self):
+        """(ret, frame) with the newest frame not handed out yet.
+
+        Blocks until one arrives; returns (False, None) once the source has
+        ended or nothing arrives within ``read_timeout`` seconds.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._buffer or self._ended or self._stopped,
+                                       timeout=self.read_timeout) or not self._buffer:
+                return False, None
+            if self.drop_frames:
+                # Hand out the newest frame and discard anything older
+                frame = self._buffer.pop()
+                self.frames_dropped += len(self._buffer)
+                self._buffer.clear()
+            else:
+                frame = self._buffer.popleft()
+            self._cond.notify_all()
+        self.frames_read += 1
+        self._processing_rate.mark()
+        return True, frame
+
+    def get(self, prop):
+        with self._device_lock:
+            return self._cap.get(prop)
+
+    def set(self, prop, value):
+        with self._device_lock:
+            return self._cap.set(prop, value)
+
+    def media_time(self):
+        """Clock for the frame last read: wall time when live, position in the recording otherwise."""
+        if self.live:
+            return time.monotonic()
+        return self.frames_read / self._fps
+
+    @property
+    def capture_fps(self):
+        """Frames per second arriving from the device."""
+        return self._capture_rate.hz
+
+    @property
+    def processing_fps(self):
+        """Frames per second the caller actually consumes with ``read``."""
+        return self._processing_rate.hz
+
+    def stats(self):
+        return {
+            "frames_captured": self.frames_captured,
+            "frames_read": self.frames_read,
+            "frames_dropped": self.frames_dropped,
+            "capture_fps": self.capture_fps,
+            "processing_fps": self.processing_fps,
+        }
+
+    def release(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+        with self._device_lock:
+            self._cap.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
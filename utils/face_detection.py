@@ -0,0 +1,149 @@
+"""Face detection front-end for the face_recognition calls.
+
+One ``FaceLocator`` serves both the face_recognition encoder and the
+verification overlay. By default it uses cvzone's MediaPipe ``FaceDetector``,
+whose boxes are converted to face_recognition's (top, right, bottom, left)
+format and passed straight to ``face_encodings``. dlib's detector only runs
+as a fallback when MediaPipe finds nothing. It runs on an RGB copy
+downscaled by ``scale``, and its boxes are mapped back to full resolution.
+"""
+import time
+
+import cv2
+import face_recognition
+import numpy as np
+from cvzone.FaceDetectionModule import FaceDetector
+
+DETECTION_SCALE = 0.5
+DETECTION_MODEL = "mediapipe"  # or "hog" / "cnn" to always use dlib
+FALLBACK_MODEL = "hog"
+MIN_DETECTION_CONFIDENCE = 0.7
+
+
+def bbox_to_location(bbox, frame_shape):
+    """cvzone (x, y, w, h) -> face_recognition (top, right, bottom, left), clamped."""
+    height, width = frame_shape[:2]
+    x, y, w, h = bbox
+    return max(0, y), min(width, x + w), min(height, y + h), max(0, x)
+
+
+def location_to_bbox(location):
+    """face_recognition (top, right, bottom, left) -> cvzone (x, y, w, h)."""
+    top, right, bottom, left = location
+    return left, top, right - left, bottom - top
+
+
+class FaceLocator:
+    def __init__(self, scale=DETECTION_SCALE, model=DETECTION_MODEL, upsample=1,
+                 fallback=FALLBACK_MODEL, min_confidence=MIN_DETECTION_CONFIDENCE):
+        self.scale = scale
+        self.model = model
+        self.upsample = upsample
+        self.fallback = fallback
+        self.min_confidence = min_confidence
+        self._mediapipe_detector = None
+        self.calls = 0
+        self.fallbacks = 0
+        self.last_detect_seconds = 0.0
+        self.total_detect_seconds = 0.0
+
+    @property
+    def _mediapipe(self):
+        # Created on first use so dlib-only locators never load MediaPipe
+        if self._mediapipe_detector is None:
+            self._mediapipe_detector = FaceDetector(minDetectionCon=self.min_confidence)
+        return self._mediapipe_detector
+
+    @staticmethod
+    def to_rgb(frame):
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+    def _timed(self, start):
+        self.last_detect_seconds = time.perf_counter() - start
+        self.total_detect_seconds += self.last_detect_seconds
+        self.calls += 1
+
+    def find_faces(self, frame, draw=False):
+        """cvzone-style (frame, faces) from the MediaPipe detector, for the overlay loops."""
+        start = time.perf_counter()
+        frame, faces = self._mediapipe.findFaces(frame, draw=draw)
+        self._timed(start)
+        return frame, faces
+
+    def _locate_dlib(self, rgb, model):
+        if self.scale != 1.0:
+            small = cv2.resize(rgb, (0, 0), fx=self.scale, fy=self.scale,
+                               interpolation=cv2.INTER_AREA)
+        else:
+            small = rgb
+        found = face_recognition.face_locations(small, number_of_times_to_upsample=self.upsample,
+                                                model=model)
+        height, width = rgb.shape[:2]
+        return [(max(0, int(top / self.scale)), min(width, int(right / self.scale)),
+                 min(height, int(bottom / self.scale)), max(0, int(left / self.scale)))
+                for top, right, bottom, left in found]
+
+    def _locate(self, frame, rgb, faces=None):
+        start = time.perf_counter()
+        locations = []
+        if self.model == "mediapipe":
+            if faces is None:
+                _, faces = self._mediapipe.findFaces(frame, draw=False)
+            locations = [bbox_to_location(face["bbox"], frame.shape) for face in faces or []]
+            if not locations and self.fallback:
+                self.fallbacks += 1
+                locations = self._locate_dlib(rgb, self.fallback)
+        else:
+            locations = self._locate_dlib(rgb, self.model)
+        self._timed(start)
+        return locations
+
+    def locate(self, frame, faces=None, rgb=None):
+        """(top, right, bottom, left) face boxes in a full-resolution BGR frame.
+
+        ``faces`` may be MediaPipe results already computed for this frame
+        (e.g. by ``find_faces``) so the detector does not run twice.
+        """
+        return self._locate(frame, self.to_rgb(frame) if rgb is None else rgb, faces)
+
+    def encode(self, frame, locations, rgb=None):
+        """Encodings for already located faces in a BGR frame."""
+        if not locations:
+            return []
+        return face_recognition.face_encodings(self.to_rgb(frame) if rgb is None else rgb, locations)
+
+    def encode_batch(self, frames, locations):
+        """One encoding per (frame, location) pair, computed in one dlib call.
+
+        ``face_recognition.face_encodings`` runs the descriptor network once
+        per face; dlib's batch overload runs it once for the whole list.
+        """
+        if not frames:
+            return []
+        rgbs = [self.to_rgb(frame) for frame in frames]
+        try:
+            import dlib
+            from face_recognition import api
+            shapes = [dlib.full_object_detections([api.pose_predictor_5_point(rgb, api._css_to_rect(location))])
+                      for rgb, location in zip(rgbs, locations)]
+            return [np.array(descriptors[0]) for descriptors in
+                    api.face_encoder.compute_face_descriptor(rgbs, shapes)]
+        except (ImportError, AttributeError, TypeError):
+            # Older dlib without the batch overload
+            return [face_recognition.face_encodings(rgb, [location])[0]
+                    for rgb, location in zip(rgbs, locations)]
+
+    def detect_and_encode(self, frame, max_faces=None, faces=None):
+        """(locations, encodings) for a BGR frame, converting to RGB only once.
+
+        With ``max_faces`` only the first faces found are encoded.
+        """
+        rgb = self.to_rgb(frame)
+        locations = self._locate(frame, rgb, faces)
+        if not locations:
+            return [], []
+        return locations, face_recognition.face_encodings(rgb, locations[:max_faces])
+
+    @property
+    def average_detect_seconds(self):
+        return self.total_detect_seconds / self.calls if self.calls else 0.0
@@ -0,0 +1,308 @@
+"""Packed, memory-mapped storage for registered face encodings.
+
+Layout inside the faces directory:
+
+- ``embeddings.f32``: every encoding as raw float32 rows, appended in
+  registration order. The row number is the user id.
+- ``index.jsonl``: one small JSON record per line mapping id -> name and the
+  card metadata. Deleting a user appends a ``{"id": .., "deleted": true}``
+  tombstone. Ids are never renumbered: the verification log and the
+  Dashboard's user index refer to users by id.
+- ``ivf_centroids.npy``: the trained IVF quantizer, reused by rebuilds of a
+  large gallery's index (see ``utils.ann_index``).
+
+Loading the gallery is one read of the index plus one ``np.memmap`` of the
+embeddings, and the mapped pages are shared by every session in the process
+(and by the OS page cache across processes).
+
+Writers in several processes (the pages, the service, the bulk enroller)
+serialize on an OS lock of ``store.lock``, so row ids taken from the
+embeddings file size always match the rows they point at.
+"""
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import numpy as np
+
+from utils.ann_index import build_index
+from utils.gallery import FaceGallery
+
+EMBEDDING_DIM = 128
+EMBEDDINGS_FILE = "embeddings.f32"
+INDEX_FILE = "index.jsonl"
+CENTROIDS_FILE = "ivf_centroids.npy"
+LOCK_FILE = "store.lock"
+
+_write_lock = threading.Lock()
+
+
+@contextmanager
+def store_write_lock(directory):
+    """Exclusive write access to the store in ``directory``, across threads and processes."""
+    directory = Path(directory)
+    with _write_lock:
+        directory.mkdir(parents=True, exist_ok=True)
+        with open(directory / LOCK_FILE, "a+b") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+StoreChanges = namedtuple("StoreChanges", ["added", "removed"])
+
+
+def read_index(path, offset=0):
+    """Yield (end_offset, record) for each complete index line after ``offset``.
+
+    ``record`` is None for a line that is not valid JSON: blank, or the torn
+    tail of a write interrupted by a crash.
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            # A line without its newline is still being written
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield offset, record
+
+
+class FaceStore:
+    """Reader/writer for one faces directory.
+
+    ``append`` and ``remove`` only write to disk; the in-memory view changes
+    through ``load`` and ``refresh``, which also pick up writes made by other
+    sessions or processes.
+    """
+
+    def __init__(self, directory, dim=EMBEDDING_DIM):
+        self.directory = Path(directory)
+        self.dim = dim
+        self.embeddings_path = self.directory / EMBEDDINGS_FILE
+        self.index_path = self.directory / INDEX_FILE
+        self.records = {}  # id -> record (name + metadata)
+        self._mmap = np.empty((0, dim), dtype=np.float32)
+        self._index_offset = 0
+        self._index_inode = None
+
+    @property
+    def row_bytes(self):
+        return self.dim * np.dtype(np.float32).itemsize
+
+    def exists(self):
+        return self.index_path.exists()
+
+    def load(self):
+        """Read the whole side index and map the embeddings file."""
+        self.records = {}
+        self._mmap = np.empty((0, self.dim), dtype=np.float32)
+        self._index_offset = 0
+        self._index_inode = None
+        self.refresh()
+        return self
+
+    def refresh(self):
+        """Apply index lines appended since the last load/refresh.
+
+        Returns ``StoreChanges(added_records, removed_records)``, or None when the
+        index was replaced on disk (e.g. restored from a backup) and had to be reloaded whole.
+        """
+        added, removed = [], []
+        if self.index_path.exists():
+            stat = self.index_path.stat()
+            if self._index_inode is not None and (stat.st_ino != self._index_inode
+                                                  or stat.st_size < self._index_offset):
+                self.load()
+                return None
+            self._index_inode = stat.st_ino
+            for self._index_offset, record in read_index(self.index_path, self._index_offset):
+                if record is None:
+                    continue
+                if record.get("deleted"):
+                    removed_record = self.records.pop(record["id"], None)
+                    if removed_record is not None:
+                        removed.append(removed_record)
+                else:
+                    self.records[record["id"]] = record
+                    added.append(record)
+        self._remap()
+        return StoreChanges(added, removed)
+
+    def _remap(self):
+        rows = self._row_count()
+        if rows == self._mmap.shape[0]:
+            return
+        if rows:
+            self._mmap = np.memmap(self.embeddings_path, dtype=np.float32, mode="r",
+                                   shape=(rows, self.dim))
+        else:
+            self._mmap = np.empty((0, self.dim), dtype=np.float32)
+
+    def _row_count(self):
+        if not self.embeddings_path.exists():
+            return 0
+        return self.embeddings_path.stat().st_size // self.row_bytes
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def ids(self):
+        return sorted(self.records)
+
+    @property
+    def names(self):
+        return [self.records[i]["name"] for i in self.ids]
+
+    @property
+    def embeddings(self):
+        """Live encodings as an (N, dim) float32 array, in ``ids`` order.
+
+        Returns the memory map itself when no rows have been deleted.
+        """
+        ids = self.ids
+        if len(ids) == self._mmap.shape[0]:
+            return self._mmap
+        return np.asarray(self._mmap[ids])
+
+    def users(self):
+        """{name: encoding} in the shape the pages used to build from JSON files."""
+        return dict(zip(self.names, self.embeddings))
+
+    def gallery(self):
+        return FaceGallery(self.names, self.embeddings)
+
+    def index(self, kind="auto", **kwargs):
+        """Searchable index over the live encodings (see ``utils.ann_index``)."""
+        kwargs.setdefault("centroids_path", self.directory / CENTROIDS_FILE)
+        return build_index(self.names, self.embeddings, kind=kind, **kwargs)
+
+    @property
+    def rows(self):
+        """Every row appended so far, deleted ones included, as the raw memory map."""
+        return self._mmap
+
+    def embedding(self, user_id):
+        return self._mmap[user_id]
+
+    def find(self, name):
+        for record in self.records.values():
+            if record["name"] == name:
+                return record
+        return None
+
+    def metadata(self):
+        """Every live record without its encoding, for display."""
+        return [dict(self.records[i]) for i in self.ids]
+
+    def append(self, name, encoding, **metadata):
+        """Append one user; returns the new id."""
+        return self.append_many([(name, encoding, metadata)])[0]
+
+    def append_many(self, users):
+        """Append (name, encoding, metadata) triples with one write per file.
+
+        Returns the new ids. Readers see either none of the batch or all of
+        it, except after a crash mid-write, which can leave unused rows and
+        one torn index line that ``refresh`` skips.
+        """
+        users = list(users)
+        if not users:
+            return []
+        rows = np.asarray([encoding for _, encoding, _ in users], dtype=np.float32)
+        rows = rows.reshape(len(users), self.dim)
+        with store_write_lock(self.directory):
+            # Embeddings first: an index line must never point past the end of
+            # the embeddings file.
+            with open(self.embeddings_path, "ab") as f:
+                # Ids come from the size on disk, which no other writer can change under the lock
+                size = os.fstat(f.fileno()).st_size
+                partial = size % self.row_bytes
+                if partial:
+                    # Pad out a row left half-written by an earlier crash
+                    f.write(b"\0" * (self.row_bytes - partial))
+                first_id = -(-size // self.row_bytes)
+                f.write(rows.tobytes())
+            lines = []
+            now = time.time()
+            for offset, (name, _, metadata) in enumerate(users):
+                metadata = dict(metadata)
+                record = {"id": first_id + offset, "name": name,
+                          "registered_at": metadata.pop("registered_at", now)}
+                record.update(metadata)
+                lines.append(json.dumps(record) + "\n")
+            with open(self.index_path, "ab+") as f:
+                # Start on a fresh line if an earlier write was torn
+                if f.tell():
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        lines.insert(0, "\n")
+                f.write("".join(lines).encode("utf-8"))
+        return list(range(first_id, first_id + len(users)))
+
+    def remove(self, name):
+        """Tombstone every record registered under ``name``."""
+        removed = [i for i, r in self.records.items() if r["name"] == name]
+        if not removed:
+            return False
+        with store_write_lock(self.directory):
+            with open(self.index_path, "a") as f:
+                for user_id in removed:
+                    f.write(json.dumps({"id": user_id, "deleted": True}) + "\n")
+        return True
+
+
+def migrate_json_faces(directory, store=None):
+    """One-shot import of the legacy ``<name>.json`` files into a FaceStore.
+
+    Users already present in the store are skipped, so running it twice is
+    harmless. The JSON files are left in place.
+    """
+    directory = Path(directory)
+    store = store or FaceStore(directory).load()
+    known = set(store.names)
+    migrated = 0
+    for json_file in sorted(directory.glob("*.json")):
+        with open(json_file, "r") as f:
+            user_data = json.load(f)
+        if "encoding" not in user_data or user_data["name"] in known:
+            continue
+        encoding = user_data.pop("encoding")
+        name = user_data.pop("name")
+        user_data.setdefault("registered_at", json_file.stat().st_ctime)
+        store.append(name, encoding, **user_data)
+        known.add(name)
+        migrated += 1
+    return migrated
+
+
+def open_face_store(directory):
+    """Load the store in ``directory``, migrating legacy JSON files on first use."""
+    store = FaceStore(directory)
+    if not store.exists():
+        migrate_json_faces(directory, store)
+    return store.load()
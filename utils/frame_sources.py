@@ -0,0 +1,188 @@
+"""Frame sources beyond a local camera.
+
+``ThreadedCapture`` opens any of these through ``open_reader``:
+
+- a camera index (``0`` or ``"0"``),
+- a video file,
+- a directory of images, played in name order by ``ImageSequenceReader``,
+- a network stream URL (``rtsp://``, ``http://`` ...).
+
+``MJPEGServer`` re-serves a file or image folder as a local MJPEG stream at
+a fixed frame rate. It stands in for an IP camera when testing the live
+(frame-dropping) path without hardware.
+"""
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import cv2
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+STREAM_PREFIXES = ("rtsp://", "rtsps://", "http://", "https://", "udp://", "tcp://")
+DEFAULT_SEQUENCE_FPS = 30.0
+
+
+def camera_index(source):
+    """The camera index for ``0`` or ``"0"``, else None."""
+    if isinstance(source, int):
+        return source
+    if isinstance(source, str) and source.strip().isdigit():
+        return int(source)
+    return None
+
+
+def is_live(source):
+    """Cameras and network streams run in real time; files and folders do not."""
+    return camera_index(source) is not None or (
+        isinstance(source, str) and source.lower().startswith(STREAM_PREFIXES))
+
+
+class ImageSequenceReader:
+    """``cv2.VideoCapture``-like reader over the images in a directory."""
+
+    def __init__(self, directory, fps=DEFAULT_SEQUENCE_FPS, loop=False):
+        self.paths = sorted(p for p in Path(directory).iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+        self.fps = fps
+        self.loop = loop
+        self.position = 0
+        self._opened = bool(self.paths)
+        self._shape = None
+
+    def isOpened(self):
+        return self._opened
+
+    def read(self):
+        while self._opened:
+            if self.position >= len(self.paths):
+                if not self.loop:
+                    return False, None
+                self.position = 0
+            path = self.paths[self.position]
+            self.position += 1
+            frame = cv2.imread(str(path))
+            if frame is not None:
+                self._shape = frame.shape
+                return True, frame
+            print(f"Skipping unreadable image {path}")
+        return False, None
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return len(self.paths)
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.position
+        if prop in (cv2.CAP_PROP_FRAME_WIDTH, cv2.CAP_PROP_FRAME_HEIGHT) and self._shape:
+            return self._shape[1] if prop == cv2.CAP_PROP_FRAME_WIDTH else self._shape[0]
+        return 0.0
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            self.position = max(0, min(int(value), len(self.paths)))
+            return True
+        if prop == cv2.CAP_PROP_FPS:
+            self.fps = float(value)
+            return True
+        return False
+
+    def release(self):
+        self._opened = False
+
+
+def open_reader(source):
+    """A ``cv2.VideoCapture``-compatible reader for any supported source."""
+    index = camera_index(source)
+    if index is not None:
+        return cv2.VideoCapture(index)
+    if os.path.isdir(source):
+        return ImageSequenceReader(source)
+    return cv2.VideoCapture(str(source))
+
+
+class MJPEGServer:
+    """Serve a recording as a live ``multipart/x-mixed-replace`` MJPEG stream.
+
+        with MJPEGServer("clip.mp4", fps=15) as server:
+            cap = ThreadedCapture(server.url)
+    """
+
+    def __init__(self, source, port=0, fps=None, quality=80, loop=True, host="127.0.0.1"):
+        self.source = source
+        self.quality = quality
+        self.loop = loop
+        reader = open_reader(source)
+        self.fps = fps or reader.get(cv2.CAP_PROP_FPS) or DEFAULT_SEQUENCE_FPS
+        reader.release()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/stream.mjpg"
+
+    def _frames(self):
+        while True:
+            reader = open_reader(self.source)
+            try:
+                while True:
+                    ret, frame = reader.read()
+                    if not ret:
+                        break
+                    ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+                    if ok:
+                        yield jpeg.tobytes()
+            finally:
+                reader.release()
+            if not self.loop:
+                return
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/stream.mjpg":
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=frame")
+                self.end_headers()
+                interval = 1.0 / server.fps
+                next_time = time.monotonic()
+                try:
+                    for jpeg in server._frames():
+                        # Paced like a real camera: frames come at fps whether or not anyone keeps up
+                        next_time += interval
+                        time.sleep(max(0.0, next_time - time.monotonic()))
+                        self.wfile.write(b"--frame\r\nContent-Type: image/jpeg\r\n")
+                        self.wfile.write(f"Content-Length: {len(jpeg)}\r\n\r\n".encode())
+                        self.wfile.write(jpeg + b"\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._server.serve_forever, name="mjpeg-server",
+                                            daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,103 @@
+"""Vectorized 1:N face matching over the registered gallery."""
+from collections import namedtuple
+
+import numpy as np
+
+# Same default as face_recognition.compare_faces
+DEFAULT_TOLERANCE = 0.6
+
+GalleryMatch = namedtuple("GalleryMatch", ["name", "distance", "candidates"])
+
+
+class FaceGallery:
+    """All registered encodings held as one contiguous (N, 128) float matrix.
+
+    Distances are the same euclidean distances face_recognition.face_distance
+    returns, but computed for the whole gallery in a single matrix operation
+    instead of one compare_faces call per user.
+    """
+
+    def __init__(self, names=(), encodings=()):
+        self.names = list(names)
+        if len(self.names):
+            # Float arrays (including a read-only memmap) are used as-is, no copy
+            matrix = np.asarray(encodings)
+            if matrix.dtype.kind != "f":
+                matrix = matrix.astype(np.float64)
+            self._matrix = np.ascontiguousarray(matrix)
+        else:
+            self._matrix = np.empty((0, 128), dtype=np.float64)
+        if self._matrix.shape[0] != len(self.names):
+            raise ValueError("names and encodings must have the same length")
+        self._sq_norms = np.einsum("ij,ij->i", self._matrix, self._matrix)
+        # Rows removed since the gallery was built stay in the matrix, masked out
+        self._alive = np.ones(len(self.names), dtype=bool)
+        self.removed = 0
+
+    @classmethod
+    def from_users(cls, users):
+        """Build a gallery from a {name: encoding} dict."""
+        return cls(users.keys(), list(users.values()))
+
+    def __len__(self):
+        return len(self.names) - self.removed
+
+    @property
+    def matrix(self):
+        return self._matrix
+
+    def add(self, name, encoding):
+        row = np.asarray(encoding, dtype=self._matrix.dtype).reshape(1, -1)
+        self._matrix = np.vstack([self._matrix, row])
+        self._sq_norms = np.append(self._sq_norms, np.einsum("ij,ij->i", row, row))
+        self.names.append(name)
+        self._alive = np.append(self._alive, True)
+
+    def remove(self, name):
+        """Mask out every live row registered as ``name``; returns how many."""
+        rows = [i for i, n in enumerate(self.names) if n == name and self._alive[i]]
+        self._alive[rows] = False
+        self.removed += len(rows)
+        return len(rows)
+
+    def distances(self, encodings):
+        """Distance from each probe encoding to every gallery entry, shape (M, N)."""
+        probes = np.atleast_2d(np.asarray(encodings, dtype=self._matrix.dtype))
+        if not len(self.names):
+            return np.empty((probes.shape[0], 0))
+        sq = (np.einsum("ij,ij->i", probes, probes)[:, None]
+              + self._sq_norms[None, :]
+              - 2.0 * probes @ self._matrix.T)
+        dists = np.sqrt(np.maximum(sq, 0.0))
+        if self.removed:
+            # Removed rows never win
+            dists[:, ~self._alive] = np.inf
+        return dists
+
+    def match_many(self, encodings, tolerance=DEFAULT_TOLERANCE, top_k=1):
+        """Match several probes (e.g. every face in a frame) in one pass."""
+        dists = self.distances(encodings)
+        k = min(max(top_k, 1), len(self))
+        results = []
+        for row in dists:
+            if not k:
+                results.append(GalleryMatch(None, None, []))
+                continue
+            idx = np.argpartition(row, k - 1)[:k]
+            idx = idx[np.argsort(row[idx])]
+            candidates = [(self.names[i], float(row[i])) for i in idx]
+            best_name, best_dist = candidates[0]
+            results.append(GalleryMatch(best_name if best_dist <= tolerance else None,
+                                        best_dist, candidates))
+        return results
+
+    def match(self, encoding, tolerance=DEFAULT_TOLERANCE, top_k=1):
+        """Best match for a single encoding.
+
+        ``name`` is None when the closest entry is farther than ``tolerance``;
+        ``candidates`` lists the ``top_k`` closest (name, distance) pairs.
+        """
+        return self.match_many([encoding], tolerance=tolerance, top_k=top_k)[0]
+
+    def contains(self, encoding, tolerance=DEFAULT_TOLERANCE):
+        return self.match(encoding, tolerance=tolerance).name is not None
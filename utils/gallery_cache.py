@@ -0,0 +1,174 @@
+"""One shared, incrementally refreshed gallery per server process.
+
+Streamlit re-executes a page script on every rerun but imports ``utils``
+modules only once, so a module-level cache survives reruns and is shared by
+every browser session in the process. Each ``get`` stats the two store files
+(inode, size, mtime); when nothing changed it is a cache hit. Registrations
+and deletions are applied to the live index in place; deleted rows are only
+masked out. Only the first load or a rewritten store rebuilds on the request
+path. Once more than ``COMPACT_RATIO`` of the rows are masked, a compacted
+index is built on a background thread, outside the lock, and swapped in.
+
+Writes made through the cache also bring the Dashboard's SQLite user index
+(``utils.user_index``) up to date.
+"""
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from utils.ann_index import build_index
+from utils.face_store import CENTROIDS_FILE, FaceStore, open_face_store
+from utils.user_index import get_user_index
+
+COMPACT_RATIO = 0.25
+
+
+class GalleryCache:
+    def __init__(self, directory, index_kind="auto"):
+        self.directory = Path(directory)
+        self.index_kind = index_kind
+        self.store = None
+        self._index = None
+        self._signature = None
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.full_reloads = 0
+        self.incremental_reloads = 0
+        self.compactions = 0
+        self._compacting = False
+        self.last_reload_seconds = 0.0
+        self.total_reload_seconds = 0.0
+
+    def _file_signature(self):
+        signature = []
+        for name in ("index.jsonl", "embeddings.f32"):
+            try:
+                stat = (self.directory / name).stat()
+                signature.append((stat.st_ino, stat.st_size, stat.st_mtime_ns))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def get(self):
+        """The current gallery index, refreshed only if the store changed on disk."""
+        with self._lock:
+            # Take the signature before reading so a write racing with the
+            # refresh shows up as a change on the next call.
+            signature = self._file_signature()
+            if self._index is not None and signature == self._signature:
+                self.hits += 1
+                return self._index
+
+            self.misses += 1
+            start = time.perf_counter()
+            changes = self.store.refresh() if self.store is not None else None
+            if changes is None:
+                if self.store is None:
+                    self.store = open_face_store(self.directory)
+                self._index = self.store.index(kind=self.index_kind)
+                self.full_reloads += 1
+            else:
+                for record in changes.removed:
+                    self._index.remove(record["name"])
+                for record in changes.added:
+                    # Skip users deleted again within the same refresh
+                    if record["id"] in self.store.records:
+                        self._index.add(record["name"], self.store.embedding(record["id"]))
+                self.incremental_reloads += 1
+                self._maybe_compact()
+            self._signature = signature
+            self.last_reload_seconds = time.perf_counter() - start
+            self.total_reload_seconds += self.last_reload_seconds
+            return self._index
+
+    def _maybe_compact(self):
+        if self._compacting or self._index.removed <= COMPACT_RATIO * max(1, len(self._index)):
+            return
+        self._compacting = True
+        ids = self.store.ids
+        snapshot = (self.full_reloads, ids, [self.store.records[i]["name"] for i in ids],
+                    self.store.rows)
+        threading.Thread(target=self._compact, args=snapshot, name="gallery-compact", daemon=True).start()
+
+    def _compact(self, generation, ids, names, embeddings):
+        try:
+            # The slow part (copying rows, assigning or training cells) runs unlocked
+            index = build_index(names, np.asarray(embeddings[ids]), kind=self.index_kind,
+                                centroids_path=self.directory / CENTROIDS_FILE)
+            with self._lock:
+                if generation != self.full_reloads:
+                    return  # the store was reloaded meanwhile; that index is already fresh
+                # Replay changes made while the compacted index was being built
+                records = self.store.records
+                for user_id, name in zip(ids, names):
+                    if user_id not in records:
+                        index.remove(name)
+                for user_id in sorted(set(records) - set(ids)):
+                    index.add(records[user_id]["name"], self.store.embedding(user_id))
+                self._index = index
+                self.compactions += 1
+        except Exception as e:
+            print(f"Error compacting the gallery index: {e}")
+        finally:
+            self._compacting = False
+
+    def metadata(self):
+        """Display records for every user, without touching the encodings."""
+        with self._lock:
+            self.get()
+            return self.store.metadata()
+
+    def name_taken(self, name):
+        """Whether a live user is already registered as ``name``."""
+        with self._lock:
+            self.get()
+            return self.store.find(name) is not None
+
+    def append(self, name, encoding, **metadata):
+        with self._lock:
+            user_id = FaceStore(self.directory).append(name, encoding, **metadata)
+            self.get()
+            get_user_index(self.directory)
+            return user_id
+
+    def remove(self, name):
+        with self._lock:
+            self.get()
+            removed = self.store.remove(name)
+            self.get()
+            get_user_index(self.directory)
+            return removed
+
+    def invalidate(self):
+        with self._lock:
+            self.store = None
+            self._index = None
+            self._signature = None
+
+    def stats(self):
+        return {
+            "users": len(self.store) if self.store is not None else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "full_reloads": self.full_reloads,
+            "incremental_reloads": self.incremental_reloads,
+            "compactions": self.compactions,
+            "last_reload_seconds": self.last_reload_seconds,
+            "total_reload_seconds": self.total_reload_seconds,
+        }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_gallery_cache(directory):
+    """The process-wide GalleryCache for ``directory``."""
+    key = Path(directory).resolve()
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = GalleryCache(key)
+        return _caches[key]
@@ -0,0 +1,155 @@
+"""Login and registration without a window, a keyboard or a camera.
+
+    python -m utils.headless login clips/alice.mp4 clips/bob/ --faces-dir faces
+    python -m utils.headless register photos/carol/ --name "Carol Ann Smith"
+
+Runs the same pipeline as the Login and Sign Up pages over any frame source
+(video file, image folder, stream URL or camera index). Nothing is shown, and
+each 'L'/'V' key press is replaced by a rule:
+
+- login tries to identify the user on every frame with a face, then runs
+  the OK-sign verification until it succeeds or the source ends;
+- register enrolls the first frame that has exactly one face.
+
+Frames are processed as fast as the CPU allows. Hold times follow the
+recording's own clock. One JSON line is printed per source.
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import cv2
+
+from utils import metrics
+from utils.capture import ThreadedCapture
+from utils.face_detection import FaceLocator
+from utils.gallery_cache import get_gallery_cache
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_FACES_DIR = ROOT_DIR / "faces"
+DEFAULT_MODEL = ROOT_DIR / "assets" / "best.pt"
+
+
+def create_pipeline(cap, faces_dir=DEFAULT_FACES_DIR, model_path=DEFAULT_MODEL):
+    from cvzone.HandTrackingModule import HandDetector
+    from utils.models import get_antispoof_model
+    from utils.pipeline import build_auth_pipeline
+
+    cache = get_gallery_cache(faces_dir)
+    return build_auth_pipeline(FaceLocator(), get_antispoof_model(str(model_path)),
+                               HandDetector(detectionCon=0.8, maxHands=1), cache.get,
+                               clock=cap.media_time)
+
+
+def headless_login(cap, pipeline, verify=True, max_frames=None):
+    """Identify, then verify, the user in ``cap``; returns a result dict."""
+    result = {"user": None, "outcome": "no_face", "verified": False, "frames": 0}
+    pipeline.flow = "login"
+    while max_frames is None or result["frames"] < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        result["frames"] += 1
+        ctx = pipeline.process(frame)
+        # Same checks as pressing 'L' on the Login page
+        if ctx["encoding"] is None:
+            continue
+        faces = ctx["liveness"]["faces"]
+        if faces != 1:
+            result["outcome"] = "no_face" if not faces else "multiple_faces"
+            continue
+        if not ctx["liveness"]["real"]:
+            result["outcome"] = "spoof"
+            continue
+        match = ctx["match"]
+        if match.name:
+            result.update(user=match.name, outcome="recognized")
+            break
+        result["outcome"] = "not_recognized"
+    metrics.record_capture(cap, "login")
+    metrics.outcomes.inc(flow="login", outcome=result["outcome"])
+
+    if result["user"] and verify:
+        pipeline.flow = "verification"
+        pipeline.reset()
+        while max_frames is None or result["frames"] < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            result["frames"] += 1
+            if pipeline.process(cv2.flip(frame, 1), "hold")["hold"]["success"]:
+                result["verified"] = True
+                break
+        metrics.record_capture(cap, "verification")
+        metrics.outcomes.inc(flow="verification", outcome="success" if result["verified"] else "abandoned")
+    return result
+
+
+def headless_register(cap, name, faces_dir=DEFAULT_FACES_DIR, face_locator=None, max_frames=None,
+                      **card):
+    """Enroll ``name`` from the first frame of ``cap`` with exactly one face."""
+    face_locator = face_locator or FaceLocator()
+    cache = get_gallery_cache(faces_dir)
+    result = {"user": name, "outcome": "no_face", "frames": 0}
+    while max_frames is None or result["frames"] < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        result["frames"] += 1
+        locations, encodings = face_locator.detect_and_encode(frame)
+        if len(locations) != 1:
+            continue
+        # Same checks as pressing 'V' on the Sign Up page
+        if cache.get().contains(encodings[0]):
+            result["outcome"] = "duplicate"
+            break
+        if cache.name_taken(name):
+            result["outcome"] = "name_taken"
+            break
+        cache.append(name, encodings[0], visa_number=card.get("visa_number", ""),
+                     expiration_date=card.get("expiration_date", ""), cvv=card.get("cvv", ""))
+        cv2.imwrite(str(Path(faces_dir) / f"{name}.jpg"), frame)
+        result["outcome"] = "registered"
+        break
+    metrics.record_capture(cap, "signup")
+    metrics.outcomes.inc(flow="signup", outcome=result["outcome"])
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run login or registration without a display.")
+    parser.add_argument("mode", choices=["login", "register"])
+    parser.add_argument("sources", nargs="+", help="video files, image folders, stream URLs or camera indexes")
+    parser.add_argument("--faces-dir", default=str(DEFAULT_FACES_DIR))
+    parser.add_argument("--model", default=str(DEFAULT_MODEL), help="anti-spoof YOLO weights")
+    parser.add_argument("--name", help="full name to register (register mode)")
+    parser.add_argument("--no-verify", action="store_true", help="skip the OK-sign verification")
+    parser.add_argument("--max-frames", type=int, help="give up on a source after this many frames")
+    args = parser.parse_args(argv)
+    if args.mode == "register" and not args.name:
+        parser.error("--name is required to register")
+
+    for source in args.sources:
+        start = time.perf_counter()
+        cap = ThreadedCapture(source)
+        try:
+            if not cap.isOpened():
+                result = {"outcome": "unreadable_source", "frames": 0}
+            elif args.mode == "login":
+                result = headless_login(cap, create_pipeline(cap, args.faces_dir, args.model),
+                                        verify=not args.no_verify, max_frames=args.max_frames)
+            else:
+                result = headless_register(cap, args.name, args.faces_dir, max_frames=args.max_frames)
+        finally:
+            cap.release()
+        elapsed = time.perf_counter() - start
+        result.update(source=str(source), seconds=round(elapsed, 3),
+                      fps=round(result["frames"] / elapsed, 1) if elapsed else None)
+        print(json.dumps(result), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+"""Background image encoding and writing.
+
+``cv2.imwrite`` of a lossless 640x480 PNG takes tens of milliseconds. The
+verification loop used to call it inline, at the very moment the success
+message appears. ``ImageWriter.submit`` copies the frame onto a bounded
+queue and returns a ``Future`` immediately. Worker threads then encode and
+write it:
+
+- the codec is configurable: PNG compression level, or JPEG/WebP quality;
+- each file is written to a temporary name and renamed into place, so
+  readers never see a half-written image;
+- the Future resolves to the written path, or raises the encode/write
+  error, for the caller to report. ``after(path, image)`` runs on the
+  worker once the file is in place, e.g. to store its thumbnail.
+
+The screenshot codec comes from ``SCREENSHOT_FORMAT`` (png, jpg or webp)
+and ``SCREENSHOT_QUALITY``: the PNG compression level 0-9, or the
+JPEG/WebP quality 0-100.
+"""
+import atexit
+import os
+import queue
+import threading
+from collections import namedtuple
+from concurrent.futures import Future
+from pathlib import Path
+
+import cv2
+
+DEFAULT_WORKERS = 1
+DEFAULT_MAX_QUEUE = 8
+# format -> (cv2 parameter, default level)
+CODECS = {
+    "png": (cv2.IMWRITE_PNG_COMPRESSION, 3),
+    "jpg": (cv2.IMWRITE_JPEG_QUALITY, 95),
+    "webp": (cv2.IMWRITE_WEBP_QUALITY, 90),
+}
+
+Codec = namedtuple("Codec", ["format", "quality"])
+
+
+def make_codec(fmt="png", quality=None):
+    """A validated Codec; ``quality`` defaults to the format's usual level."""
+    fmt = fmt.lower().lstrip(".").replace("jpeg", "jpg")
+    if fmt not in CODECS:
+        raise ValueError(f"Unsupported image format {fmt!r}; choose from {', '.join(CODECS)}")
+    quality = CODECS[fmt][1] if quality is None else int(quality)
+    limit = 9 if fmt == "png" else 100
+    if not 0 <= quality <= limit:
+        raise ValueError(f"{fmt} quality must be between 0 and {limit}")
+    return Codec(fmt, quality)
+
+
+FACE_CODEC = make_codec("jpg")
+
+
+def screenshot_codec():
+    """The verification screenshot codec from ``SCREENSHOT_FORMAT``/``SCREENSHOT_QUALITY``."""
+    return make_codec(os.environ.get("SCREENSHOT_FORMAT", "png"), os.environ.get("SCREENSHOT_QUALITY"))
+
+
+def encode(image, codec):
+    ok, data = cv2.imencode(f".{codec.format}", image, [CODECS[codec.format][0], codec.quality])
+    if not ok:
+        raise ValueError(f"Could not encode image as {codec.format}")
+    return data.tobytes()
+
+
+def write_atomic(path, data):
+    """Write ``data`` to ``path`` through a temporary file and a rename."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{threading.get_ident()}.tmp")
+    try:
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return path
+
+
+class WriterOverloaded(Exception):
+    """The write queue is full; the image was not queued."""
+
+
+class ImageWriter:
+    def __init__(self, workers=DEFAULT_WORKERS, max_queue=DEFAULT_MAX_QUEUE):
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.written = 0
+        self.failed = 0
+        self.rejected = 0
+        self.last_error = None
+        self._threads = [threading.Thread(target=self._worker, name=f"image-writer-{i}", daemon=True)
+                         for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, path, image, codec=FACE_CODEC, after=None):
+        """Future for the written path; raises WriterOverloaded when the queue is full.
+
+        ``image`` is copied, so the caller may keep drawing on it.
+        """
+        future = Future()
+        try:
+            self.queue.put_nowait((Path(path), image.copy(), codec, after, future))
+        except queue.Full:
+            self.rejected += 1
+            raise WriterOverloaded("Image write queue is full")
+        return future
+
+    def _worker(self):
+        while True:
+            path, image, codec, after, future = self.queue.get()
+            try:
+                if future.set_running_or_notify_cancel():
+                    future.set_result(self._write(path, image, codec, after))
+            except Exception as e:
+                self.failed += 1
+                self.last_error = e
+                future.set_exception(e)
+            finally:
+                self.queue.task_done()
+
+    def _write(self, path, image, codec, after):
+        write_atomic(path, encode(image, codec))
+        self.written += 1
+        if after is not None:
+            try:
+                after(path, image)
+            except Exception as e:
+                # The image itself is in place; only the follow-up failed
+                self.last_error = e
+                print(f"Error after writing {path}: {e}")
+        return path
+
+    def flush(self, timeout=None):
+        """Wait until every queued image has been written; False on timeout."""
+        with self.queue.all_tasks_done:
+            return self.queue.all_tasks_done.wait_for(lambda: not self.queue.unfinished_tasks, timeout)
+
+    def stats(self):
+        return {"queued": self.queue.qsize(), "written": self.written, "failed": self.failed,
+                "rejected": self.rejected}
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_image_writer():
+    """The process-wide ImageWriter; queued images are flushed at exit."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ImageWriter()
+            atexit.register(_writer.flush, 5.0)
+        return _writer
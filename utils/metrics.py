@@ -0,0 +1,235 @@
+"""Hot-path instrumentation exported in Prometheus text format.
+
+Counters and latency histograms live in one process-wide registry, so every
+Streamlit page sees the same numbers. ``start_metrics_export()`` writes the
+registry to ``metrics/auth.prom`` every few seconds; a node_exporter textfile
+collector can pick that up. Setting ``AUTH_METRICS_PORT`` also serves it at
+``http://localhost:<port>/metrics``.
+"""
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_METRICS_FILE = ROOT_DIR / "metrics" / "auth.prom"
+DEFAULT_EXPORT_INTERVAL = 5.0
+# Guards starting the exporter thread and the HTTP endpoint
+_start_lock = threading.Lock()
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _label_text(names, values):
+    if not names:
+        return ""
+    escape = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    pairs = ",".join(f'{n}="{escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(n, "") for n in self.labels)
+
+    def inc(self, amount=1, **labels):
+        with self._lock:
+            self.values[self._key(labels)] += amount
+
+    def value(self, **labels):
+        return self.values.get(self._key(labels), 0.0)
+
+    def total(self):
+        return sum(self.values.values())
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in sorted(self.values.items())]
+
+
+class Histogram(Counter):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [bucket counts..., count, sum]
+        self.values = defaultdict(lambda: [0] * len(self.buckets) + [0, 0.0])
+
+    def observe(self, value, **labels):
+        with self._lock:
+            row = self.values[self._key(labels)]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+            row[-2] += 1
+            row[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        row = self.values.get(self._key(labels))
+        return row[-2] if row else 0
+
+    def mean(self, **labels):
+        row = self.values.get(self._key(labels))
+        return row[-1] / row[-2] if row and row[-2] else None
+
+    def quantile(self, q, **labels):
+        """Upper bucket bound below which a fraction ``q`` of observations fall."""
+        row = self.values.get(self._key(labels))
+        if not row or not row[-2]:
+            return None
+        target = q * row[-2]
+        for bound, cumulative in zip(self.buckets, row):
+            if cumulative >= target:
+                return bound
+        return float("inf")
+
+    def samples(self):
+        out = []
+        with self._lock:
+            for key, row in sorted(self.values.items()):
+                for bound, cumulative in zip(self.buckets, row):
+                    out.append((f"{self.name}_bucket", key + (bound,), cumulative))
+                out.append((f"{self.name}_bucket", key + ("+Inf",), row[-2]))
+                out.append((f"{self.name}_count", key, row[-2]))
+                out.append((f"{self.name}_sum", key, row[-1]))
+        return out
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}
+        self.started_at = time.time()
+        self._server = None
+        self._exporter = None
+
+    def counter(self, name, help, labels=()):
+        return self.metrics.setdefault(name, Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.metrics.setdefault(name, Histogram(name, help, labels, buckets))
+
+    def render(self):
+        """The whole registry in Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, value in metric.samples():
+                names = metric.labels + ("le",) if name.endswith("_bucket") else metric.labels
+                lines.append(f"{name}{_label_text(names, key)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path=DEFAULT_METRICS_FILE):
+        # Written to a temp file and renamed so scrapers never see half a file
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(self.render())
+        os.replace(tmp, path)
+        return path
+
+    def serve(self, port, host="127.0.0.1"):
+        """Serve ``/metrics`` from a daemon thread."""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        # Pages load concurrently; only one of them may bind the port
+        with _start_lock:
+            if self._server is None:
+                self._server = ThreadingHTTPServer((host, port), Handler)
+                threading.Thread(target=self._server.serve_forever, daemon=True).start()
+            return self._server
+
+    def start_export(self, path=DEFAULT_METRICS_FILE, interval=DEFAULT_EXPORT_INTERVAL):
+        """Rewrite ``path`` every ``interval`` seconds from a daemon thread (idempotent)."""
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.write(path)
+                except OSError as e:
+                    print(f"Error writing metrics: {e}")
+
+        # Pages load concurrently; only one of them may start the thread
+        with _start_lock:
+            if self._exporter is None:
+                self._exporter = threading.Thread(target=loop, daemon=True)
+                self._exporter.start()
+            return self._exporter
+
+
+_registry = MetricsRegistry()
+
+stage_seconds = _registry.histogram(
+    "auth_stage_seconds", "Exclusive time spent in each pipeline stage.", ("flow", "stage"))
+frame_seconds = _registry.histogram(
+    "auth_frame_seconds", "End-to-end processing time per camera frame.", ("flow",))
+frames_processed = _registry.counter(
+    "auth_frames_processed_total", "Camera frames processed.", ("flow",))
+frames_dropped = _registry.counter(
+    "auth_frames_dropped_total", "Camera frames overwritten before being read.", ("flow",))
+spoof_rejections = _registry.counter(
+    "auth_spoof_rejections_total", "Anti-spoof inferences that found no real face.", ("flow",))
+recognition_misses = _registry.counter(
+    "auth_recognition_misses_total", "Face encodings that matched no registered user.", ("flow",))
+outcomes = _registry.counter(
+    "auth_outcomes_total", "Finished login, verification and sign-up attempts.", ("flow", "outcome"))
+
+
+def get_metrics():
+    return _registry
+
+
+def start_metrics_export(path=DEFAULT_METRICS_FILE, interval=DEFAULT_EXPORT_INTERVAL):
+    """Start the file exporter, and the HTTP endpoint if ``AUTH_METRICS_PORT`` is set."""
+    _registry.start_export(path, interval)
+    port = os.environ.get("AUTH_METRICS_PORT")
+    if port:
+        try:
+            _registry.serve(int(port))
+        except (OSError, ValueError) as e:
+            print(f"Error starting metrics endpoint: {e}")
+    return _registry
+
+
+def record_capture(cap, flow):
+    """Count the frames ``cap`` read and dropped since the last call."""
+    seen = getattr(cap, "_metrics_seen", (0, 0))
+    read, dropped = getattr(cap, "frames_read", 0), getattr(cap, "frames_dropped", 0)
+    frames_processed.inc(read - seen[0], flow=flow)
+    frames_dropped.inc(dropped - seen[1], flow=flow)
+    cap._metrics_seen = (read, dropped)
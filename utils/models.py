@@ -0,0 +1,194 @@
+"""Process-wide, pre-warmed YOLO anti-spoofing model.
+
+The model is constructed once per server process and shared by every stage
+and session. ``warm_up_async`` loads it and runs one dummy inference on a
+background thread so the first verification frame does not pay for the load
+or the cold first pass.
+
+``ANTISPOOF_BACKEND`` picks which export of the weights is loaded (see
+``utils.antispoof_export``): ``pytorch`` (best.pt, the default), ``onnx``,
+``onnx-int8`` or ``openvino``. A backend that has not been exported falls
+back to the PyTorch weights.
+"""
+import os
+import threading
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+from ultralytics import YOLO
+
+CLASS_NAMES = ["fake", "real"]
+WARMUP_SHAPE = (480, 640, 3)
+
+# Face-ROI inference: crop the detected face plus this fraction of its size on
+# every side and classify it at a small fixed input size (a multiple of 32).
+ROI_MARGIN = 0.4
+ROI_INPUT_SIZE = 160
+
+Detection = namedtuple("Detection", ["label", "confidence", "box"])  # box: (x1, y1, x2, y2)
+
+# Where each backend's export lives, relative to the .pt weights
+BACKENDS = {
+    "pytorch": "{stem}.pt",
+    "onnx": "{stem}.onnx",
+    "onnx-int8": "{stem}_int8.onnx",
+    "openvino": "{stem}_openvino_model",
+}
+DEFAULT_BACKEND = "pytorch"
+_missing_exports = set()
+
+
+def resolve_model_path(model_path, backend=None):
+    """The weights to load for ``backend`` (default: ``ANTISPOOF_BACKEND``)."""
+    backend = backend or os.environ.get("ANTISPOOF_BACKEND") or DEFAULT_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown anti-spoof backend {backend!r}; choose from {', '.join(BACKENDS)}")
+    model_path = str(model_path)
+    base, ext = os.path.splitext(model_path)
+    if ext != ".pt":
+        return model_path
+    exported = os.path.join(os.path.dirname(model_path),
+                            BACKENDS[backend].format(stem=os.path.basename(base)))
+    if not os.path.exists(exported):
+        if exported not in _missing_exports:
+            _missing_exports.add(exported)
+            print(f"No {backend} export at {exported}; using {model_path}")
+        return model_path
+    return exported
+
+
+class AntiSpoofModel:
+    def __init__(self, model_path):
+        self.model_path = str(model_path)
+        self._model = None
+        self._load_lock = threading.Lock()
+        # ultralytics predictors are not safe to call from several threads at once
+        self._infer_lock = threading.Lock()
+        self._warmup_thread = None
+        self.ready = threading.Event()
+        self.load_seconds = None
+        self.warmup_seconds = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    start = time.perf_counter()
+                    self._model = YOLO(self.model_path, task="detect")
+                    self.load_seconds = time.perf_counter() - start
+        return self._model
+
+    def warm_up(self):
+        model = self.model
+        if not self.ready.is_set():
+            start = time.perf_counter()
+            with self._infer_lock:
+                model(np.zeros(WARMUP_SHAPE, dtype=np.uint8), verbose=False)
+                model(np.zeros((ROI_INPUT_SIZE, ROI_INPUT_SIZE, 3), dtype=np.uint8),
+                      imgsz=ROI_INPUT_SIZE, verbose=False)
+            self.warmup_seconds = time.perf_counter() - start
+            self.ready.set()
+        return self
+
+    def warm_up_async(self):
+        """Start loading and warming up in the background; safe to call repeatedly."""
+        with self._load_lock:
+            if self._warmup_thread is None:
+                self._warmup_thread = threading.Thread(target=self._warm_up_quietly,
+                                                       name="antispoof-warmup", daemon=True)
+                self._warmup_thread.start()
+        return self
+
+    def _warm_up_quietly(self):
+        try:
+            self.warm_up()
+        except Exception as e:
+            print(f"Anti-spoof model warm-up failed: {e}")
+
+    def predict(self, frame, **kwargs):
+        """Raw ultralytics results for ``frame``."""
+        model = self.model
+        with self._infer_lock:
+            return list(model(frame, stream=False, verbose=False, **kwargs))
+
+    def detect(self, frame, **kwargs):
+        """Every box in ``frame`` as a Detection with a "fake"/"real" label."""
+        return [d for result in self.predict(frame, **kwargs) for d in _detections(result)]
+
+    def detect_batch(self, frames, **kwargs):
+        """``detect`` for several frames in one batched inference."""
+        if not frames:
+            return []
+        return [_detections(result) for result in self.predict(list(frames), **kwargs)]
+
+    def detect_face(self, frame, face_box, margin=ROI_MARGIN, input_size=ROI_INPUT_SIZE):
+        """Classify only the region around ``face_box`` (x, y, w, h).
+
+        Returned boxes are mapped back to ``frame`` coordinates so they can be
+        drawn on the full frame.
+        """
+        return self.detect_faces([frame], [face_box], margin, input_size)[0]
+
+    def detect_faces(self, frames, face_boxes, margin=ROI_MARGIN, input_size=ROI_INPUT_SIZE):
+        """``detect_face`` for several (frame, face_box) pairs in one batched inference."""
+        crops = [crop_face_roi(frame, box, margin, input_size) for frame, box in zip(frames, face_boxes)]
+        valid = [crop for crop in crops if crop[0] is not None]
+        batch = iter(self.detect_batch([roi for roi, _, _ in valid], imgsz=input_size))
+        out = []
+        for roi, (x0, y0), scale in crops:
+            if roi is None:
+                out.append([])
+                continue
+            detections = []
+            for d in next(batch):
+                x1, y1, x2, y2 = d.box
+                detections.append(d._replace(box=(int(x1 / scale) + x0, int(y1 / scale) + y0,
+                                                  int(x2 / scale) + x0, int(y2 / scale) + y0)))
+            out.append(detections)
+        return out
+
+
+def _detections(result):
+    detections = []
+    for box in result.boxes:
+        x1, y1, x2, y2 = (int(v) for v in box.xyxy[0])
+        detections.append(Detection(CLASS_NAMES[int(box.cls[0])], float(box.conf[0]), (x1, y1, x2, y2)))
+    return detections
+
+
+def crop_face_roi(frame, face_box, margin=ROI_MARGIN, input_size=ROI_INPUT_SIZE):
+    """Square crop around ``face_box`` resized so its longer side is ``input_size``.
+
+    Returns (roi, (x0, y0), scale) where a point p in the roi maps back to
+    ``p / scale + (x0, y0)`` in the frame, or (None, (0, 0), 1.0) if the box
+    lies outside the frame.
+    """
+    frame_h, frame_w = frame.shape[:2]
+    x, y, w, h = face_box
+    side = max(w, h) * (1 + 2 * margin)
+    cx, cy = x + w / 2, y + h / 2
+    x0, y0 = max(0, int(cx - side / 2)), max(0, int(cy - side / 2))
+    x1, y1 = min(frame_w, int(cx + side / 2)), min(frame_h, int(cy + side / 2))
+    if x1 <= x0 or y1 <= y0:
+        return None, (0, 0), 1.0
+    crop = frame[y0:y1, x0:x1]
+    scale = input_size / max(crop.shape[:2])
+    roi = cv2.resize(crop, (max(1, round(crop.shape[1] * scale)), max(1, round(crop.shape[0] * scale))),
+                     interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+    return roi, (x0, y0), scale
+
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def get_antispoof_model(model_path, backend=None):
+    """The shared AntiSpoofModel for ``model_path`` on ``backend`` (see ``resolve_model_path``)."""
+    key = resolve_model_path(model_path, backend)
+    with _models_lock:
+        if key not in _models:
+            _models[key] = AntiSpoofModel(key)
+        return _models[key]
@@ -0,0 +1,270 @@
+"""Single-pass authentication pipeline with a shared per-frame context.
+
+Login used to open the camera twice and detect everything again in each
+step. ``AuthPipeline`` is built from small stages keyed by the value they
+produce:
+
+    faces -> encoding -> match -> liveness -> gesture -> hold
+
+A ``FrameContext`` is created per frame. ``ctx["match"]`` runs the match
+stage, which asks for ``ctx["encoding"]``, which asks for ``ctx["faces"]``,
+and so on. Each value is computed at most once per frame, and only if
+something needs it. Model stages go through the pipeline's
+``StageScheduler``, so they also keep their own cadence across frames.
+Per-stage wall time is recorded in ``timings`` and in ``utils.metrics``.
+"""
+import math
+import time
+from collections import defaultdict, deque
+
+from utils import metrics
+from utils.scheduler import StageScheduler
+
+# Detection zones (x, y, w, h) of the verification overlay
+FACE_AREA = (100, 100, 200, 200)
+HAND_AREA = (300, 100, 200, 200)
+SPOOF_CONFIDENCE = 0.6
+OK_SIGN_DISTANCE = 40
+HOLD_SECONDS = 5
+
+
+def _inside(point, area):
+    x, y = point
+    return area[0] < x < area[0] + area[2] and area[1] < y < area[1] + area[3]
+
+
+def is_ok_sign(hand, ok_distance=OK_SIGN_DISTANCE):
+    """Thumb tip (landmark 4) and index tip (landmark 8) touching."""
+    thumb_tip = hand["lmList"][4][:2]
+    index_tip = hand["lmList"][8][:2]
+    return math.hypot(thumb_tip[0] - index_tip[0], thumb_tip[1] - index_tip[1]) < ok_distance
+
+
+class FrameContext:
+    """Everything known about one frame; values are computed on first access."""
+
+    def __init__(self, pipeline, frame, index):
+        self.pipeline = pipeline
+        self.frame = frame  # never drawn on; overlays go on a copy
+        self.index = index
+        self.timestamp = pipeline.clock()
+        self.values = {}
+
+    def __getitem__(self, key):
+        if key not in self.values:
+            self.values[key] = self.pipeline.compute(key, self)
+        return self.values[key]
+
+    def __contains__(self, key):
+        return key in self.values
+
+
+class Stage:
+    """A pipeline step producing ``ctx[provides]``."""
+
+    provides = None
+
+    def __call__(self, ctx):
+        raise NotImplementedError
+
+    def reset(self):
+        pass
+
+
+class FaceDetectStage(Stage):
+    provides = "faces"
+
+    def __init__(self, face_locator):
+        self.face_locator = face_locator
+
+    def __call__(self, ctx):
+        scheduler = ctx.pipeline.scheduler
+        if scheduler.due("face"):
+            _, faces = self.face_locator.find_faces(ctx.frame, draw=False)
+            scheduler.update("face", faces, position=faces[0]["center"] if faces else None)
+        return scheduler.result("face") or []
+
+
+class EncodeStage(Stage):
+    """128-d encoding of the first face in view (None if there is none)."""
+
+    provides = "encoding"
+
+    def __init__(self, face_locator):
+        self.face_locator = face_locator
+
+    def __call__(self, ctx):
+        _, encodings = self.face_locator.detect_and_encode(ctx.frame, max_faces=1, faces=ctx["faces"])
+        return encodings[0] if encodings else None
+
+
+class MatchStage(Stage):
+    provides = "match"
+
+    def __init__(self, load_gallery):
+        self.load_gallery = load_gallery
+
+    def __call__(self, ctx):
+        encoding = ctx["encoding"]
+        if encoding is None:
+            return None
+        match = self.load_gallery().match(encoding)
+        if match.name is None:
+            metrics.recognition_misses.inc(flow=ctx.pipeline.flow)
+        return match
+
+
+class LivenessStage(Stage):
+    """Anti-spoof detections on the face region, whether the face is real and the face count.
+
+    Only a single face is checked; with ``faces`` other than 1 the frame is
+    not real, and callers report the face count rather than a spoof.
+    """
+
+    provides = "liveness"
+
+    def __init__(self, model, confidence=SPOOF_CONFIDENCE):
+        self.model = model
+        self.confidence = confidence
+
+    def __call__(self, ctx):
+        faces = ctx["faces"]
+        if len(faces) != 1:
+            return {"detections": [], "real": False, "faces": len(faces)}
+        face = faces[0]
+        scheduler = ctx.pipeline.scheduler
+        inferred = scheduler.due("antispoof", position=face["center"])
+        if inferred:
+            scheduler.update("antispoof", self.model.detect_face(ctx.frame, face["bbox"]),
+                             position=face["center"])
+        detections = [d for d in scheduler.result("antispoof") or []
+                      if math.ceil(d.confidence * 100) / 100 > self.confidence]
+        real = any(d.label == "real" for d in detections)
+        if inferred and not real:
+            metrics.spoof_rejections.inc(flow=ctx.pipeline.flow)
+        return {"detections": detections, "real": real, "faces": 1}
+
+
+class GestureStage(Stage):
+    """OK hand sign inside the hand zone."""
+
+    provides = "gesture"
+
+    def __init__(self, hand_detector, hand_area=HAND_AREA, ok_distance=OK_SIGN_DISTANCE):
+        self.hand_detector = hand_detector
+        self.hand_area = hand_area
+        self.ok_distance = ok_distance
+
+    def __call__(self, ctx):
+        scheduler = ctx.pipeline.scheduler
+        if scheduler.due("hands"):
+            # draw=False keeps the shared frame clean for the other stages
+            found = self.hand_detector.findHands(ctx.frame, draw=False, flipType=False)
+            hands = found[0] if isinstance(found, tuple) else found
+            scheduler.update("hands", hands, position=hands[0]["center"] if hands else None)
+        hands = scheduler.result("hands") or []
+        inside = ok_sign = False
+        if hands:
+            hand = hands[0]
+            inside = _inside(hand["center"], self.hand_area)
+            ok_sign = is_ok_sign(hand, self.ok_distance)
+        return {"hands": hands, "inside": inside, "ok_sign": ok_sign}
+
+
+class HoldTimerStage(Stage):
+    """Counts down while face, liveness and gesture all hold; latches on success."""
+
+    provides = "hold"
+
+    def __init__(self, face_area=FACE_AREA, seconds=HOLD_SECONDS):
+        self.face_area = face_area
+        self.seconds = seconds
+        self.reset()
+
+    def reset(self):
+        self.start_time = None
+        self.success = False
+
+    def __call__(self, ctx):
+        faces = ctx["faces"]
+        face_inside = len(faces) == 1 and _inside(faces[0]["center"], self.face_area)
+        face_real = face_inside and ctx["liveness"]["real"]
+        gesture = ctx["gesture"]
+        remaining = None
+        if face_real and gesture["inside"] and gesture["ok_sign"] and not self.success:
+            if self.start_time is None:
+                self.start_time = ctx.timestamp
+            remaining = int(self.seconds - (ctx.timestamp - self.start_time))
+            if remaining <= 0:
+                self.success = True
+        elif not self.success:
+            self.start_time = None
+        return {"face_inside": face_inside, "face_real": face_real,
+                "remaining": remaining, "success": self.success}
+
+
+class AuthPipeline:
+    def __init__(self, stages, scheduler=None, timing_window=120, flow="login", clock=time.monotonic):
+        self.stages = {stage.provides: stage for stage in stages}
+        self.flow = flow  # metrics label; the pages switch it between login and verification
+        # Recorded sources pass their frame position so hold times follow the video, not the CPU
+        self.clock = clock
+        self.scheduler = scheduler or default_scheduler(clock)
+        self.timings = defaultdict(lambda: deque(maxlen=timing_window))
+        self.frames = 0
+        self._nested = []
+
+    def compute(self, key, ctx):
+        stage = self.stages[key]
+        self._nested.append(0.0)
+        start = time.perf_counter()
+        try:
+            value = stage(ctx)
+        finally:
+            elapsed = time.perf_counter() - start
+            upstream = self._nested.pop()
+            if self._nested:
+                self._nested[-1] += elapsed
+        # Only this stage's own time, not upstream stages it pulled in
+        self.timings[key].append(elapsed - upstream)
+        metrics.stage_seconds.observe(elapsed - upstream, flow=self.flow, stage=key)
+        return value
+
+    def process(self, frame, *keys):
+        """New context for ``frame``, eagerly computing ``keys``."""
+        self.frames += 1
+        self.scheduler.tick()
+        ctx = FrameContext(self, frame, self.frames)
+        for key in keys:
+            ctx[key]
+        return ctx
+
+    def reset(self):
+        for stage in self.stages.values():
+            stage.reset()
+        self.scheduler.reset()
+
+    def stage_ms(self):
+        """Mean milliseconds per stage over the recent window."""
+        return {key: 1000 * sum(times) / len(times) for key, times in self.timings.items() if times}
+
+
+def default_scheduler(clock=time.monotonic):
+    # Results are carried forward between runs and a stage re-runs
+    # immediately when the face/hand moves more than 25px
+    scheduler = StageScheduler(clock=clock)
+    scheduler.add_stage("face", every=1, max_age=0.5)
+    scheduler.add_stage("antispoof", every=5, max_age=0.5, motion_threshold=25)
+    scheduler.add_stage("hands", every=2, max_age=0.3, motion_threshold=25)
+    return scheduler
+
+
+def build_auth_pipeline(face_locator, model, hand_detector, load_gallery, clock=time.monotonic):
+    return AuthPipeline([
+        FaceDetectStage(face_locator),
+        EncodeStage(face_locator),
+        MatchStage(load_gallery),
+        LivenessStage(model),
+        GestureStage(hand_detector),
+        HoldTimerStage(),
+    ], clock=clock)
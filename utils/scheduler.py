@@ -0,0 +1,117 @@
+"""Per-stage inference cadence for the camera loops.
+
+Each stage (face detector, anti-spoof model, hand detector, ...) runs every
+``every`` frames. In between, its last result is carried forward until it is
+older than ``max_age`` seconds. A stage also re-runs on the very next frame
+when its tracked position jumps by more than ``motion_threshold`` pixels,
+either relative to a position the caller passes to ``due`` or between its
+own last two results. That way a moving face or hand is refreshed at full
+frame rate and a still one at the configured cadence.
+"""
+import math
+import time
+from collections import deque
+
+
+class _Stage:
+    def __init__(self, every, max_age, motion_threshold, window):
+        self.every = max(1, int(every))
+        self.max_age = max_age
+        self.motion_threshold = motion_threshold
+        self.result = None
+        self.position = None
+        self.last_frame = None
+        self.last_time = None
+        self.force = True
+        self.runs = deque()
+        self.window = window
+
+
+class StageScheduler:
+    def __init__(self, hz_window=2.0, clock=time.monotonic):
+        self.frame = 0
+        self.hz_window = hz_window
+        self._clock = clock
+        self._stages = {}
+        self._frames = deque()
+
+    def add_stage(self, name, every=1, max_age=None, motion_threshold=None):
+        self._stages[name] = _Stage(every, max_age, motion_threshold, self.hz_window)
+        return self
+
+    def tick(self):
+        """Advance to the next frame; call once at the top of the loop."""
+        self.frame += 1
+        self._record(self._frames)
+
+    def _record(self, runs):
+        now = self._clock()
+        runs.append(now)
+        while runs and now - runs[0] > self.hz_window:
+            runs.popleft()
+
+    @staticmethod
+    def _moved(a, b, threshold):
+        if threshold is None or a is None or b is None:
+            return False
+        return math.hypot(a[0] - b[0], a[1] - b[1]) > threshold
+
+    def _expired(self, stage):
+        return (stage.max_age is not None and stage.last_time is not None
+                and self._clock() - stage.last_time > stage.max_age)
+
+    def due(self, name, position=None):
+        """Whether ``name`` should run on this frame."""
+        stage = self._stages[name]
+        return (stage.force or stage.last_frame is None
+                or self.frame - stage.last_frame >= stage.every
+                or self._expired(stage)
+                or self._moved(position, stage.position, stage.motion_threshold))
+
+    def update(self, name, result, position=None):
+        """Store a fresh result (and the tracked position it was computed at)."""
+        stage = self._stages[name]
+        stage.force = self._moved(position, stage.position, stage.motion_threshold)
+        stage.result = result
+        stage.position = position
+        stage.last_frame = self.frame
+        stage.last_time = self._clock()
+        self._record(stage.runs)
+
+    def run(self, name, fn, position=None):
+        """Call ``fn()`` if the stage is due, otherwise return the carried-forward result."""
+        if self.due(name, position):
+            self.update(name, fn(), position)
+        return self.result(name)
+
+    def result(self, name):
+        """Last result, or None once it has expired."""
+        stage = self._stages[name]
+        return None if self._expired(stage) else stage.result
+
+    def age(self, name):
+        """Frames since ``name`` last ran (None if it never has)."""
+        stage = self._stages[name]
+        return None if stage.last_frame is None else self.frame - stage.last_frame
+
+    def reset(self, name=None):
+        for stage_name in ([name] if name else list(self._stages)):
+            stage = self._stages[stage_name]
+            stage.result = stage.position = stage.last_frame = stage.last_time = None
+            stage.force = True
+
+    @staticmethod
+    def _rate(runs):
+        if len(runs) < 2 or runs[-1] == runs[0]:
+            return 0.0
+        return (len(runs) - 1) / (runs[-1] - runs[0])
+
+    def hz(self, name):
+        """Effective runs per second of ``name`` over the last ``hz_window`` seconds."""
+        return self._rate(self._stages[name].runs)
+
+    def fps(self):
+        return self._rate(self._frames)
+
+    def rates(self):
+        return {name: self.hz(name) for name in self._stages}
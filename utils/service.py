@@ -0,0 +1,363 @@
+"""Local verification service shared by several kiosks.
+
+    python -m utils.service --port 8765 --faces-dir faces
+
+``/identify`` and ``/liveness`` take a JPEG frame as the POST body, with
+options in the query string. ``/enroll`` takes a JSON body holding the
+base64 JPEG and the card details, so they never appear in a URL. Responses
+are JSON.
+
+    POST /identify?liveness=1          {"faces", "name", "distance", "real"}
+    POST /liveness[?box=x,y,w,h]       {"faces", "real", "detections"}
+    POST /enroll  {"image", "name", "visa_number", "expiration_date", "cvv"}
+                                       {"outcome": "registered" | "duplicate" | "name_taken" | "no_face"}
+    GET  /health                       gallery size, queue depths, batch sizes
+    GET  /metrics                      Prometheus text
+
+Face detection, face encoding and YOLO anti-spoofing each run on one worker
+thread, so one MediaPipe graph and one model serve every request thread.
+Each worker takes requests from a bounded queue in micro-batches: it waits at
+most ``--max-wait-ms`` to fill up to ``--max-batch`` items, then runs one
+batched inference. Overload is shed instead of queued without limit:
+
+- a full queue, or more than ``--max-inflight`` open requests, gets
+  ``503`` with ``Retry-After``;
+- a request that waits longer than ``--timeout`` gets ``504``.
+
+Set ``AUTH_SERVICE_URL`` for the Streamlit pages to use the service.
+"""
+import argparse
+import base64
+import json
+import math
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import cv2
+import numpy as np
+
+from utils import metrics
+from utils.face_detection import FaceLocator, location_to_bbox
+from utils.gallery_cache import get_gallery_cache
+from utils.image_writer import FACE_CODEC, WriterOverloaded, get_image_writer
+from utils.models import get_antispoof_model
+from utils.pipeline import SPOOF_CONFIDENCE
+from utils.thumbnails import FACE_THUMBNAIL_SIDE, get_thumbnail_cache
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_FACES_DIR = ROOT_DIR / "faces"
+DEFAULT_MODEL = ROOT_DIR / "assets" / "best.pt"
+DEFAULT_PORT = 8765
+DEFAULT_MAX_BATCH = 8
+DEFAULT_MAX_WAIT = 0.01
+DEFAULT_MAX_QUEUE = 32
+DEFAULT_MAX_INFLIGHT = 64
+DEFAULT_TIMEOUT = 5.0
+MAX_BODY_BYTES = 4 * 2 ** 20
+CARD_FIELDS = ("visa_number", "expiration_date", "cvv")
+RETRY_AFTER_SECONDS = 1
+
+requests_total = metrics.get_metrics().counter(
+    "service_requests_total", "Verification service requests.", ("endpoint", "status"))
+batch_size = metrics.get_metrics().histogram(
+    "service_batch_size", "Items per micro-batch.", ("worker",), buckets=(1, 2, 4, 8, 16, 32))
+
+
+class Overloaded(Exception):
+    """The request was shed because a queue or the in-flight limit is full."""
+
+
+class MicroBatcher:
+    """Collects submitted items into batches for ``process_batch`` on one worker thread.
+
+    ``process_batch(items)`` must return one result per item.
+    """
+
+    def __init__(self, name, process_batch, max_batch=DEFAULT_MAX_BATCH, max_wait=DEFAULT_MAX_WAIT,
+                 max_queue=DEFAULT_MAX_QUEUE):
+        self.name = name
+        self.process_batch = process_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.batches = 0
+        self.items = 0
+        self.rejected = 0
+        self._thread = threading.Thread(target=self._worker, name=f"{name}-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        """Future for ``item``'s result; raises Overloaded when the queue is full."""
+        future = Future()
+        try:
+            self.queue.put_nowait((item, future))
+        except queue.Full:
+            self.rejected += 1
+            raise Overloaded(f"{self.name} queue is full")
+        return future
+
+    def _worker(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            # Requests that already timed out were cancelled by their handler
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = self.process_batch([item for item, _ in batch])
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            self.batches += 1
+            self.items += len(batch)
+            batch_size.observe(len(batch), worker=self.name)
+
+    def stats(self):
+        return {"queued": self.queue.qsize(), "batches": self.batches, "items": self.items,
+                "mean_batch": self.items / self.batches if self.batches else 0.0,
+                "rejected": self.rejected}
+
+
+class VerificationService:
+    def __init__(self, faces_dir=DEFAULT_FACES_DIR, model_path=DEFAULT_MODEL, max_batch=DEFAULT_MAX_BATCH,
+                 max_wait=DEFAULT_MAX_WAIT, max_queue=DEFAULT_MAX_QUEUE, max_inflight=DEFAULT_MAX_INFLIGHT,
+                 timeout=DEFAULT_TIMEOUT):
+        self.faces_dir = Path(faces_dir)
+        self.cache = get_gallery_cache(self.faces_dir)
+        self.model = get_antispoof_model(str(model_path)).warm_up()
+        self.timeout = timeout
+        self.max_inflight = max_inflight
+        self._inflight = threading.BoundedSemaphore(max_inflight)
+        # Only ever used from the detect and encode worker threads
+        self._locator = FaceLocator()
+        self._encoder = FaceLocator()
+        self._enroll_lock = threading.Lock()
+        self.detect_batcher = MicroBatcher("detect", self._detect_batch, max_batch, max_wait, max_queue)
+        self.encode_batcher = MicroBatcher("encode", self._encode_batch, max_batch, max_wait, max_queue)
+        self.liveness_batcher = MicroBatcher("liveness", self._liveness_batch, max_batch, max_wait, max_queue)
+
+    def _detect_batch(self, frames):
+        # MediaPipe has no batch API; the win is one graph on one thread
+        results = []
+        for frame in frames:
+            _, faces = self._locator.find_faces(frame)
+            results.append((faces, self._locator.locate(frame, faces=faces)))
+        return results
+
+    def _encode_batch(self, items):
+        return self._encoder.encode_batch([frame for frame, _ in items], [loc for _, loc in items])
+
+    def _liveness_batch(self, items):
+        return self.model.detect_faces([frame for frame, _ in items], [box for _, box in items])
+
+    def _wait(self, future):
+        try:
+            return future.result(self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise
+
+    def _faces(self, frame):
+        return self._wait(self.detect_batcher.submit(frame))
+
+    @staticmethod
+    def _liveness_result(detections):
+        # Same threshold as the Login page's LivenessStage
+        detections = [d for d in detections if math.ceil(d.confidence * 100) / 100 > SPOOF_CONFIDENCE]
+        return {"real": any(d.label == "real" for d in detections),
+                "detections": [{"label": d.label, "confidence": d.confidence, "box": d.box}
+                               for d in detections]}
+
+    def identify(self, frame, liveness=False):
+        faces, locations = self._faces(frame)
+        result = {"faces": len(locations), "name": None, "distance": None}
+        if not locations:
+            return result
+        # Both batchers work on this frame at the same time
+        encoding = self.encode_batcher.submit((frame, locations[0]))
+        spoof = None
+        if liveness and len(locations) == 1:
+            # A face only the dlib fallback found is checked on its encoded location
+            face_box = faces[0]["bbox"] if len(faces) == 1 else location_to_bbox(locations[0])
+            spoof = self.liveness_batcher.submit((frame, face_box))
+        match = self.cache.get().match(self._wait(encoding))
+        result.update(name=match.name, distance=None if match.distance is None else float(match.distance))
+        if liveness:
+            result["real"] = spoof is not None and self._liveness_result(self._wait(spoof))["real"]
+        return result
+
+    def liveness(self, frame, face_box=None):
+        """Anti-spoof verdict for ``face_box`` (x, y, w, h), or for the single face found in ``frame``."""
+        faces = 1
+        if face_box is None:
+            found, _ = self._faces(frame)
+            faces = len(found)
+            if faces != 1:
+                return {"faces": faces, "real": False, "detections": []}
+            face_box = found[0]["bbox"]
+        detections = self._wait(self.liveness_batcher.submit((frame, face_box)))
+        return dict(faces=faces, **self._liveness_result(detections))
+
+    def enroll(self, frame, name, **card):
+        _, locations = self._faces(frame)
+        if not locations:
+            return {"outcome": "no_face"}
+        encoding = self._wait(self.encode_batcher.submit((frame, locations[0])))
+        # One enrollment at a time so two kiosks cannot register the same face at once
+        with self._enroll_lock:
+            if self.cache.get().contains(encoding):
+                return {"outcome": "duplicate"}
+            if self.cache.name_taken(name):
+                return {"outcome": "name_taken"}
+            # Queue the face image first so a full writer queue leaves nothing half-registered
+            try:
+                get_image_writer().submit(self.faces_dir / f"{name}.jpg", frame, FACE_CODEC,
+                                          after=get_thumbnail_cache(FACE_THUMBNAIL_SIDE).store)
+            except WriterOverloaded as e:
+                raise Overloaded(str(e))
+            self.cache.append(name, encoding, visa_number=card.get("visa_number", ""),
+                              expiration_date=card.get("expiration_date", ""), cvv=card.get("cvv", ""))
+        return {"outcome": "registered"}
+
+    def health(self):
+        return {"users": len(self.cache.get()), "model_ready": self.model.ready.is_set(),
+                "detect": self.detect_batcher.stats(), "encode": self.encode_batcher.stats(),
+                "liveness": self.liveness_batcher.stats()}
+
+    def handler(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send(self, status, body, content_type="application/json", headers=()):
+                data = body if isinstance(body, bytes) else json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in headers:
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+                requests_total.inc(endpoint=urlparse(self.path).path, status=status)
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                if path == "/health":
+                    self._send(200, service.health())
+                elif path == "/metrics":
+                    self._send(200, metrics.get_metrics().render().encode(), "text/plain; version=0.0.4")
+                else:
+                    self._send(404, {"error": "not found"})
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                length = int(self.headers.get("Content-Length") or 0)
+                if length > MAX_BODY_BYTES:
+                    self._send(413, {"error": "frame too large"})
+                    return
+                if not service._inflight.acquire(blocking=False):
+                    self._send(503, {"error": "too many requests in flight"},
+                               headers=[("Retry-After", str(RETRY_AFTER_SECONDS))])
+                    return
+                try:
+                    body = self.rfile.read(length)
+                    if url.path == "/enroll":
+                        if any(field in params for field in CARD_FIELDS):
+                            raise ValueError("send card details in the JSON body, not the URL")
+                        params = json.loads(body)
+                        if not isinstance(params, dict):
+                            raise ValueError("enroll body must be a JSON object")
+                        body = base64.b64decode(params.pop("image", ""))
+                    if not body:
+                        raise ValueError("body is empty; send a JPEG image")
+                    frame = cv2.imdecode(np.frombuffer(body, np.uint8), cv2.IMREAD_COLOR)
+                    if frame is None:
+                        self._send(400, {"error": "body is not a JPEG image"})
+                    elif url.path == "/identify":
+                        self._send(200, service.identify(frame, params.get("liveness") == "1"))
+                    elif url.path == "/liveness":
+                        box = tuple(int(v) for v in params["box"].split(",")) if "box" in params else None
+                        self._send(200, service.liveness(frame, box))
+                    elif url.path == "/enroll":
+                        if not params.get("name"):
+                            self._send(400, {"error": "name is required"})
+                        else:
+                            card = {field: str(params.get(field, "")) for field in CARD_FIELDS}
+                            self._send(200, service.enroll(frame, str(params["name"]), **card))
+                    else:
+                        self._send(404, {"error": "not found"})
+                except Overloaded as e:
+                    self._send(503, {"error": str(e)}, headers=[("Retry-After", str(RETRY_AFTER_SECONDS))])
+                except FutureTimeout:
+                    self._send(504, {"error": "timed out waiting for inference"})
+                except (KeyError, ValueError) as e:
+                    self._send(400, {"error": str(e)})
+                except Exception as e:
+                    self._send(500, {"error": str(e)})
+                finally:
+                    service._inflight.release()
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def serve(self, port=DEFAULT_PORT, host="127.0.0.1"):
+        server = ThreadingHTTPServer((host, port), self.handler(), bind_and_activate=False)
+        server.daemon_threads = True
+        # Let bursts reach the handler and get a 503 rather than a refused connection
+        server.request_queue_size = self.max_inflight
+        try:
+            server.server_bind()
+            server.server_activate()
+        except OSError:
+            server.server_close()
+            raise
+        return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve identify/enroll/liveness over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--faces-dir", default=str(DEFAULT_FACES_DIR))
+    parser.add_argument("--model", default=str(DEFAULT_MODEL), help="anti-spoof YOLO weights")
+    parser.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT * 1000)
+    parser.add_argument("--max-queue", type=int, default=DEFAULT_MAX_QUEUE)
+    parser.add_argument("--max-inflight", type=int, default=DEFAULT_MAX_INFLIGHT)
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT)
+    args = parser.parse_args(argv)
+
+    service = VerificationService(args.faces_dir, args.model, args.max_batch, args.max_wait_ms / 1000,
+                                  args.max_queue, args.max_inflight, args.timeout)
+    server = service.serve(args.port, args.host)
+    print(f"Verification service listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""Thin client for the verification service in ``utils.service``.
+
+The Streamlit pages use it when ``AUTH_SERVICE_URL`` is set (for example
+``http://127.0.0.1:8765``). It needs only OpenCV for JPEG encoding; no
+models are loaded in the page process.
+"""
+import base64
+import json
+import os
+import urllib.error
+import urllib.request
+from urllib.parse import urlencode
+
+import cv2
+
+from utils.models import Detection
+
+DEFAULT_TIMEOUT = 10.0
+JPEG_QUALITY = 90
+
+
+class ServiceOverloaded(Exception):
+    """The service shed the request (HTTP 503); retry after ``retry_after`` seconds."""
+
+    def __init__(self, message, retry_after=1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class VerificationClient:
+    def __init__(self, url, timeout=DEFAULT_TIMEOUT, jpeg_quality=JPEG_QUALITY):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.jpeg_quality = jpeg_quality
+
+    def _jpeg(self, frame):
+        ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            raise ValueError("Could not encode frame as JPEG")
+        return jpeg.tobytes()
+
+    def _request(self, path, frame=None, body=None, **params):
+        """POST ``frame`` as JPEG, or ``body`` as JSON; GET when there is neither."""
+        query = urlencode({k: v for k, v in params.items() if v is not None})
+        data, headers = None, {}
+        if frame is not None:
+            data, headers = self._jpeg(frame), {"Content-Type": "image/jpeg"}
+        elif body is not None:
+            data, headers = json.dumps(body).encode(), {"Content-Type": "application/json"}
+        request = urllib.request.Request(f"{self.url}{path}" + (f"?{query}" if query else ""), data=data,
+                                         headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.load(response)
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.load(e).get("error", e.reason)
+            except ValueError:
+                message = e.reason
+            if e.code == 503:
+                raise ServiceOverloaded(message, float(e.headers.get("Retry-After") or 1))
+            raise RuntimeError(f"Verification service error {e.code}: {message}")
+
+    def identify(self, frame, liveness=False):
+        return self._request("/identify", frame, liveness=1 if liveness else None)
+
+    def liveness(self, frame, face_box=None):
+        box = ",".join(str(int(v)) for v in face_box) if face_box is not None else None
+        return self._request("/liveness", frame, box=box)
+
+    def enroll(self, frame, name, **card):
+        # Card details go in the body; URLs end up in logs
+        image = base64.b64encode(self._jpeg(frame)).decode("ascii")
+        return self._request("/enroll", body=dict(card, image=image, name=name))
+
+    def health(self):
+        return self._request("/health")
+
+
+class RemoteAntiSpoofModel:
+    """Stands in for ``AntiSpoofModel`` in the Login pipeline, running inference on the service."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def warm_up_async(self):
+        return self
+
+    def detect_face(self, frame, face_box, **kwargs):
+        try:
+            result = self.client.liveness(frame, face_box)
+        except ServiceOverloaded:
+            # No verdict this round; the scheduler asks again on its next turn
+            return []
+        return [Detection(d["label"], d["confidence"], tuple(d["box"])) for d in result["detections"]]
+
+
+def get_service_client():
+    """A client for ``AUTH_SERVICE_URL``, or None to run everything in-process."""
+    url = os.environ.get("AUTH_SERVICE_URL")
+    return VerificationClient(url) if url else None
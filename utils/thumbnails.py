@@ -0,0 +1,128 @@
+"""Small pre-encoded thumbnails for the Dashboard.
+
+The Dashboard used to decode every full-size face image and screenshot on
+each rerun. Streamlit then re-encoded them. Now ``ThumbnailCache.thumbnail``
+returns ready-to-serve JPEG (or WebP) bytes for ``st.image``, from
+``thumbnails/``:
+
+- Each source file gets one thumbnail, named by a hash of its path plus the
+  source's mtime and size. Editing or replacing the source gives a new
+  name, so stale thumbnails are never served.
+- Registration and verification write the thumbnail straight from the frame
+  they already hold (``store``). Anything else is generated on first view.
+  Large JPEGs are then decoded at reduced resolution.
+"""
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+import cv2
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_THUMBNAIL_DIR = ROOT_DIR / "thumbnails"
+DEFAULT_MAX_SIDE = 320  # verification screenshots
+FACE_THUMBNAIL_SIDE = 200  # registered faces, shown at width=200
+DEFAULT_QUALITY = 80
+FORMATS = {"jpg": cv2.IMWRITE_JPEG_QUALITY, "webp": cv2.IMWRITE_WEBP_QUALITY}
+# cv2.imread flags that decode a JPEG at 1/2, 1/4 or 1/8 resolution
+_REDUCED_READS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                  (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+
+class ThumbnailCache:
+    def __init__(self, directory=DEFAULT_THUMBNAIL_DIR, max_side=DEFAULT_MAX_SIDE, fmt="jpg",
+                 quality=DEFAULT_QUALITY):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unsupported thumbnail format {fmt!r}; choose from {', '.join(FORMATS)}")
+        self.directory = Path(directory)
+        self.max_side = max_side
+        self.format = fmt
+        self.quality = quality
+        self.hits = 0
+        self.generated = 0
+
+    def _prefix(self, source):
+        return hashlib.sha1(str(Path(source).resolve()).encode("utf-8")).hexdigest()[:16]
+
+    def path_for(self, source):
+        """Thumbnail path for the current version of ``source``, or None if it does not exist."""
+        try:
+            stat = os.stat(source)
+        except OSError:
+            return None
+        return self.directory / (f"{self._prefix(source)}_{stat.st_mtime_ns}_{stat.st_size}"
+                                 f"_{self.max_side}.{self.format}")
+
+    def _read_small(self, source):
+        if Path(source).suffix.lower() not in (".jpg", ".jpeg"):
+            return cv2.imread(str(source))
+        # JPEGs decode at 1/8 scale almost for free; use the smallest
+        # reduction that still covers max_side
+        smallest = cv2.imread(str(source), cv2.IMREAD_REDUCED_COLOR_8)
+        if smallest is None:
+            return None
+        full_side = max(smallest.shape[:2]) * 8
+        for factor, flag in _REDUCED_READS:
+            if full_side / factor >= self.max_side:
+                return smallest if factor == 8 else cv2.imread(str(source), flag)
+        return cv2.imread(str(source))
+
+    def _encode(self, image):
+        scale = self.max_side / max(image.shape[:2])
+        if scale < 1:
+            image = cv2.resize(image, (max(1, round(image.shape[1] * scale)),
+                                       max(1, round(image.shape[0] * scale))), interpolation=cv2.INTER_AREA)
+        ok, data = cv2.imencode(f".{self.format}", image, [FORMATS[self.format], self.quality])
+        return data.tobytes() if ok else None
+
+    def _write(self, target, data):
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(f"{target.name}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, target)
+        # Drop thumbnails of older versions of the same source
+        for old in self.directory.glob(f"{target.name.split('_')[0]}_*_{self.max_side}.{self.format}"):
+            if old != target:
+                old.unlink(missing_ok=True)
+
+    def store(self, source, image):
+        """Thumbnail ``source`` from ``image``, its already decoded BGR pixels."""
+        target = self.path_for(source)
+        data = self._encode(image) if target is not None else None
+        if data is not None:
+            self._write(target, data)
+            self.generated += 1
+        return data
+
+    def thumbnail(self, source):
+        """Encoded thumbnail bytes for ``source``, or None if it is missing or unreadable."""
+        target = self.path_for(source)
+        if target is None:
+            return None
+        try:
+            data = target.read_bytes()
+            self.hits += 1
+            return data
+        except FileNotFoundError:
+            pass
+        image = self._read_small(source)
+        return self.store(source, image) if image is not None else None
+
+    def discard(self, source):
+        """Delete every thumbnail of ``source``."""
+        for old in self.directory.glob(f"{self._prefix(source)}_*"):
+            old.unlink(missing_ok=True)
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_thumbnail_cache(max_side=DEFAULT_MAX_SIDE, fmt="jpg"):
+    """The process-wide ThumbnailCache for one size and format."""
+    key = (max_side, fmt)
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = ThumbnailCache(max_side=max_side, fmt=fmt)
+        return _caches[key]
@@ -0,0 +1,103 @@
+"""IoU face tracker that caches each track's identity.
+
+Encoding is the most expensive call in the recognition loop, and a person
+standing still keeps the same identity from frame to frame. ``FaceTracker``
+links each frame's face boxes to existing tracks by IoU. A track is
+re-encoded only when it is new, when ``reverify_seconds`` have passed since
+its identity was checked, or when its last association was weak
+(IoU < ``confident_iou``).
+"""
+import itertools
+import time
+
+import numpy as np
+
+
+def iou_matrix(a, b):
+    """IoU between every (top, right, bottom, left) box in ``a`` and in ``b``."""
+    a = np.asarray(a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float64).reshape(-1, 4)
+    top = np.maximum(a[:, None, 0], b[None, :, 0])
+    right = np.minimum(a[:, None, 1], b[None, :, 1])
+    bottom = np.minimum(a[:, None, 2], b[None, :, 2])
+    left = np.maximum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(right - left, 0, None) * np.clip(bottom - top, 0, None)
+    area_a = (a[:, 1] - a[:, 3]) * (a[:, 2] - a[:, 0])
+    area_b = (b[:, 1] - b[:, 3]) * (b[:, 2] - b[:, 0])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+
+class Track:
+    def __init__(self, track_id, box):
+        self.id = track_id
+        self.box = box
+        self.identity = None  # GalleryMatch once encoded
+        self.verified_at = None
+        self.iou = 0.0
+        self.missed = 0
+        self.age = 0
+
+    @property
+    def name(self):
+        return self.identity.name if self.identity is not None else None
+
+
+class FaceTracker:
+    def __init__(self, min_iou=0.3, confident_iou=0.5, reverify_seconds=2.0, max_missed=5,
+                 clock=time.monotonic):
+        self.min_iou = min_iou
+        self.confident_iou = confident_iou
+        self.reverify_seconds = reverify_seconds
+        self.max_missed = max_missed
+        self._clock = clock
+        self._ids = itertools.count(1)
+        self.tracks = []
+        self.encodes = 0
+        self.cache_hits = 0
+
+    def update(self, boxes):
+        """Associate this frame's boxes with tracks; returns the tracks seen this frame."""
+        boxes = [tuple(box) for box in boxes]
+        matched_tracks, matched_boxes, seen = set(), set(), []
+        if self.tracks and boxes:
+            ious = iou_matrix([t.box for t in self.tracks], boxes)
+            # Greedy: strongest overlaps first
+            for flat in np.argsort(-ious, axis=None):
+                ti, bi = np.unravel_index(flat, ious.shape)
+                if ious[ti, bi] < self.min_iou:
+                    break
+                if ti in matched_tracks or bi in matched_boxes:
+                    continue
+                track = self.tracks[ti]
+                track.box, track.iou, track.missed = boxes[bi], float(ious[ti, bi]), 0
+                track.age += 1
+                matched_tracks.add(ti)
+                matched_boxes.add(bi)
+                seen.append(track)
+        for ti, track in enumerate(self.tracks):
+            if ti not in matched_tracks:
+                track.missed += 1
+        self.tracks = [t for t in self.tracks if t.missed <= self.max_missed]
+        for bi, box in enumerate(boxes):
+            if bi not in matched_boxes:
+                track = Track(next(self._ids), box)
+                self.tracks.append(track)
+                seen.append(track)
+        return seen
+
+    def needs_identity(self, track):
+        """Whether ``track`` must be (re-)encoded on this frame."""
+        stale = (track.identity is None
+                 or self._clock() - track.verified_at > self.reverify_seconds
+                 or track.iou < self.confident_iou)
+        if not stale:
+            self.cache_hits += 1
+        return stale
+
+    def set_identity(self, track, identity):
+        track.identity = identity
+        track.verified_at = self._clock()
+        # A fresh encoding makes the track fully confident again
+        track.iou = 1.0
+        self.encodes += 1
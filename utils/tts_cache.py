@@ -0,0 +1,208 @@
+"""Pre-synthesized speech for the voice prompts.
+
+Nearly every prompt is one of a dozen fixed phrases, so each phrase is
+synthesized once and stored under ``tts_cache/`` keyed by voice and text.
+Decoded clips stay in a small in-memory LRU. gTTS is tried first. When it
+fails, for example on a kiosk without network, the offline pyttsx3 engine
+is used instead.
+
+Greetings built from ``TEMPLATES`` (e.g. "Welcome back, {name}!") are split
+into their fixed fragments plus the name. Only the name ever needs fresh
+synthesis, and it is cached too.
+"""
+import hashlib
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from pathlib import Path
+
+import pygame
+import pyttsx3
+from gtts import gTTS
+
+DEFAULT_VOICE = "en"
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent.parent / "tts_cache"
+MEMORY_CLIPS = 64
+
+# Fixed prompts spoken by the Login and Sign Up pages
+COMMON_PHRASES = [
+    "Please face the camera and press L to start recognition",
+    "Please look at the camera and press V to capture your face",
+    "No face detected. Please try again",
+    "Spoof detected! Please use your real face",
+    "Face not recognized. Please register first",
+    "This face is already registered with another name",
+    "Thank you for verifying your identity",
+    "Resetting verification. Please start again.",
+]
+
+TEMPLATES = [
+    "Welcome back, {name}!",
+    "Hello {name}, please place your face in the box and show an OK hand sign",
+    "{name} has been registered successfully!",
+]
+
+
+def _compile_template(template):
+    pattern, fragments = "", []
+    for literal, field in re.findall(r"([^{]*)(?:\{(\w+)\})?", template):
+        pattern += re.escape(literal)
+        if literal:
+            fragments.append(literal)
+        if field:
+            pattern += "(.+?)"
+            fragments.append(None)
+    return re.compile(pattern + "$"), fragments
+
+
+_TEMPLATES = [_compile_template(t) for t in TEMPLATES]
+
+
+def split_phrase(text):
+    """The cacheable fragments ``text`` is spoken as.
+
+    Text matching one of ``TEMPLATES`` becomes its literal parts plus the
+    substituted values; anything else is a single fragment. Punctuation-only
+    fragments are dropped.
+    """
+    for pattern, fragments in _TEMPLATES:
+        match = pattern.match(text)
+        if match:
+            values = iter(match.groups())
+            parts = [next(values) if f is None else f for f in fragments]
+            return [p.strip(" ,") for p in parts if re.search(r"\w", p)]
+    return [text]
+
+
+class PhraseCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, voice=DEFAULT_VOICE, memory_clips=MEMORY_CLIPS):
+        self.cache_dir = Path(cache_dir)
+        self.voice = voice
+        self.memory_clips = memory_clips
+        self._clips = OrderedDict()
+        self._lock = threading.Lock()
+        # pyttsx3 engines are not thread-safe
+        self._offline_lock = threading.Lock()
+        self._offline_engine = None
+        self._warmup_thread = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.synthesized = 0
+        self.offline_synthesized = 0
+
+    def _key(self, text):
+        return hashlib.sha1(f"{self.voice}|{text}".encode("utf-8")).hexdigest()
+
+    def _cached_file(self, key):
+        for ext in (".mp3", ".wav"):
+            path = self.cache_dir / f"{key}{ext}"
+            if path.exists():
+                return path
+        return None
+
+    def _synthesize_online(self, text, key):
+        fp = BytesIO()
+        gTTS(text=text, lang=self.voice).write_to_fp(fp)
+        path = self.cache_dir / f"{key}.mp3"
+        self._write_atomic(path, fp.getvalue())
+        return path
+
+    def _synthesize_offline(self, text, key):
+        path = self.cache_dir / f"{key}.wav"
+        with self._offline_lock:
+            if self._offline_engine is None:
+                self._offline_engine = pyttsx3.init()
+                self._offline_engine.setProperty('rate', 150)
+            tmp = path.with_suffix(".tmp.wav")
+            self._offline_engine.save_to_file(text, str(tmp))
+            self._offline_engine.runAndWait()
+            tmp.replace(path)
+        return path
+
+    @staticmethod
+    def _write_atomic(path, data):
+        with tempfile.NamedTemporaryFile(dir=path.parent, delete=False, suffix=".tmp") as f:
+            f.write(data)
+        Path(f.name).replace(path)
+
+    def audio_file(self, text):
+        """Path of the synthesized ``text``, synthesizing it on a cache miss."""
+        key = self._key(text)
+        path = self._cached_file(key)
+        if path is not None:
+            self.disk_hits += 1
+            return path
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            path = self._synthesize_online(text, key)
+        except Exception as e:
+            print(f"gTTS unavailable ({e}); using offline speech engine")
+            path = self._synthesize_offline(text, key)
+            self.offline_synthesized += 1
+        self.synthesized += 1
+        return path
+
+    def clip(self, text):
+        """Decoded pygame Sound for ``text`` (LRU-cached in memory)."""
+        key = self._key(text)
+        with self._lock:
+            if key in self._clips:
+                self._clips.move_to_end(key)
+                self.hits += 1
+                return self._clips[key]
+        if not pygame.mixer.get_init():
+            pygame.mixer.init()
+        sound = pygame.mixer.Sound(str(self.audio_file(text)))
+        with self._lock:
+            self._clips[key] = sound
+            while len(self._clips) > self.memory_clips:
+                self._clips.popitem(last=False)
+        return sound
+
+    def clips(self, text):
+        """Clips to play back to back to speak ``text``."""
+        return [self.clip(fragment) for fragment in split_phrase(text)]
+
+    def warm(self, phrases=None):
+        """Synthesize ``phrases`` (default: every fixed prompt) ahead of time."""
+        if phrases is None:
+            fragments = [f.strip(" ,") for _, parts in _TEMPLATES for f in parts
+                         if f is not None and re.search(r"\w", f)]
+            phrases = COMMON_PHRASES + fragments
+        for phrase in phrases:
+            try:
+                self.audio_file(phrase)
+            except Exception as e:
+                print(f"Could not pre-synthesize '{phrase}': {e}")
+
+    def warm_async(self, phrases=None):
+        """Warm up on a background thread; safe to call on every rerun, only the first call starts it."""
+        with self._lock:
+            if self._warmup_thread is None:
+                self._warmup_thread = threading.Thread(target=self.warm, args=(phrases,), name="tts-warmup",
+                                                       daemon=True)
+                self._warmup_thread.start()
+            return self._warmup_thread
+
+    def stats(self):
+        return {
+            "memory_hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "synthesized": self.synthesized,
+            "offline_synthesized": self.offline_synthesized,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_phrase_cache():
+    """The process-wide PhraseCache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PhraseCache()
+        return _cache
@@ -0,0 +1,203 @@
+"""SQLite index of user metadata for the Dashboard.
+
+    python -m utils.user_index rebuild [--faces-dir faces]
+
+``faces/users.sqlite`` has one row per registered user: id, name,
+registration time, card expiry and face image file. It holds no encodings
+and no card numbers. The face store's ``index.jsonl`` stays the source of
+truth. ``sync`` applies the index lines written since the last sync, found
+by byte offset the way ``FaceStore.refresh`` does, so registrations and
+deletions from any page, process or the bulk enroller show up without
+walking the faces directory. If the store is replaced on disk, the
+table is rebuilt from scratch.
+"""
+import argparse
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from utils.face_store import INDEX_FILE, open_face_store, read_index
+
+DATABASE_FILE = "users.sqlite"
+SORT_COLUMNS = {"registered_at": "registered_at", "name": "name COLLATE NOCASE",
+                "expires_on": "expires_on"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    registered_at REAL NOT NULL,
+    expiration_date TEXT,  -- "MM/YY" as entered
+    expires_on TEXT,       -- "YYYY-MM", sortable; NULL without a card
+    image TEXT             -- face image file name inside the faces directory
+);
+CREATE INDEX IF NOT EXISTS users_name ON users (name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS users_registered_at ON users (registered_at);
+CREATE INDEX IF NOT EXISTS users_expires_on ON users (expires_on);
+CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value INTEGER);
+"""
+
+
+def expires_on(expiration_date):
+    """ "MM/YY" -> "20YY-MM", or None."""
+    try:
+        month, year = expiration_date.split("/")
+        return f"20{int(year):02d}-{int(month):02d}"
+    except (AttributeError, ValueError):
+        return None
+
+
+class UserIndex:
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.path = self.directory / DATABASE_FILE
+        self.index_path = self.directory / INDEX_FILE
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._conn:
+            # WAL lets the Dashboard read while another process syncs
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+        self._seen = None  # (inode, size) of index.jsonl at the last sync
+
+    def _state(self):
+        rows = self._conn.execute("SELECT key, value FROM sync_state").fetchall()
+        state = {row["key"]: row["value"] for row in rows}
+        return state.get("inode"), state.get("offset", 0)
+
+    def sync(self):
+        """Apply store changes since the last sync; returns the number of lines applied."""
+        try:
+            stat = self.index_path.stat()
+        except FileNotFoundError:
+            stat = None
+        seen = (stat.st_ino, stat.st_size) if stat else None
+        if seen == self._seen and seen is not None:
+            return 0
+        with self._lock, self._conn:
+            inode, offset = self._state()
+            if stat is None or inode != stat.st_ino or stat.st_size < offset:
+                # New or rewritten store: start over
+                self._conn.execute("DELETE FROM users")
+                offset = 0
+            applied = 0
+            if stat is not None:
+                for offset, record in read_index(self.index_path, offset):
+                    if record is None:
+                        continue
+                    if record.get("deleted"):
+                        self._conn.execute("DELETE FROM users WHERE id = ?", (record["id"],))
+                    else:
+                        self._conn.execute(
+                            "INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?, ?, ?)",
+                            (record["id"], record["name"], record.get("registered_at", 0),
+                             record.get("expiration_date") or None,
+                             expires_on(record.get("expiration_date")), f"{record['name']}.jpg"))
+                    applied += 1
+                self._conn.executemany("INSERT OR REPLACE INTO sync_state VALUES (?, ?)",
+                                       [("inode", stat.st_ino), ("offset", offset)])
+            self._seen = seen
+        return applied
+
+    def rebuild(self):
+        """Drop everything and re-read the whole store."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM users")
+            self._conn.execute("DELETE FROM sync_state")
+            self._seen = None
+        return self.sync()
+
+    def _search(self, search):
+        # Matches the Dashboard's search: case-insensitive, ignoring spaces
+        term = "".join(search.lower().split())
+        if not term:
+            return "", ()
+        return " WHERE replace(lower(name), ' ', '') LIKE ? ESCAPE '\\'", (
+            "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%",)
+
+    def count(self, search=""):
+        where, params = self._search(search)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM users{where}", params).fetchone()[0]
+
+    def users(self, search="", order_by="registered_at", descending=True, limit=None, offset=0):
+        """User rows as dicts, filtered by ``search`` and sorted by ``order_by``."""
+        where, params = self._search(search)
+        sql = (f"SELECT * FROM users{where} ORDER BY {SORT_COLUMNS[order_by]} "
+               f"{'DESC' if descending else 'ASC'}, id LIMIT ? OFFSET ?")
+        with self._lock:
+            rows = self._conn.execute(sql, params + (-1 if limit is None else limit, offset)).fetchall()
+        return [dict(row) for row in rows]
+
+    def user_id(self, name):
+        """Id of the user registered as ``name``, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT id FROM users WHERE name = ? ORDER BY id DESC LIMIT 1",
+                                     (name,)).fetchone()
+        return row[0] if row else None
+
+    def count_registered_since(self, timestamp):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM users WHERE registered_at >= ?",
+                                      (timestamp,)).fetchone()[0]
+
+    def daily_registrations(self):
+        """[(date, count)] in local time, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT date(registered_at, 'unixepoch', 'localtime') AS day, COUNT(*) FROM users "
+                "GROUP BY day ORDER BY day").fetchall()
+        return [(datetime.strptime(day, "%Y-%m-%d").date(), count) for day, count in rows]
+
+    def expiry_months(self):
+        """[("YYYY-MM", count)] for users with a card on file."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT expires_on, COUNT(*) FROM users WHERE expires_on IS NOT NULL "
+                "GROUP BY expires_on ORDER BY expires_on").fetchall()
+        return [tuple(row) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_user_index(directory):
+    """The process-wide, freshly synced UserIndex for ``directory``."""
+    key = Path(directory).resolve()
+    with _indexes_lock:
+        if key not in _indexes:
+            if not (key / INDEX_FILE).exists():
+                # Import legacy <name>.json files first, as the gallery does
+                open_face_store(key)
+            _indexes[key] = UserIndex(key)
+        index = _indexes[key]
+    index.sync()
+    return index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the Dashboard's SQLite user index.")
+    parser.add_argument("command", choices=["rebuild", "sync"])
+    parser.add_argument("--faces-dir", default=str(Path(__file__).resolve().parent.parent / "faces"))
+    args = parser.parse_args(argv)
+
+    if not (Path(args.faces_dir) / INDEX_FILE).exists():
+        open_face_store(args.faces_dir)
+    index = UserIndex(args.faces_dir)
+    applied = index.rebuild() if args.command == "rebuild" else index.sync()
+    print(f"{args.command}: applied {applied} index lines; {index.count()} users in {index.path}")
+    index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+"""Append-only log of anti-spoofing verifications.
+
+    python -m utils.verification_log backfill [--screenshots-dir screenshots]
+
+``screenshots/verifications.jsonl`` has one JSON line per verification
+attempt: user id and name, timestamp, outcome (``success``, ``abandoned`` or
+``error``), mean stage latencies in ms and the screenshot file name.
+Deleting a user appends a ``{"user_id": .., "deleted": true}`` tombstone, as
+the face store does. User ids are face store ids, which are never renumbered.
+
+``VerificationLog`` keeps an in-memory index over the file, by user and by
+time. ``refresh`` applies only the lines written since the last refresh
+(see ``utils.face_store.read_index``), so the Dashboard's totals and
+per-user activity never walk the screenshots directory.
+
+``backfill`` imports screenshots taken before the log existed. Each one is
+attributed to the registered user whose first name starts its file name.
+"""
+import argparse
+import bisect
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from utils.face_store import read_index
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_SCREENSHOTS_DIR = ROOT_DIR / "screenshots"
+LOG_FILE = "verifications.jsonl"
+OUTCOMES = ("success", "abandoned", "error")
+_LEGACY_SCREENSHOT = re.compile(r"^(?P<first_name>.+)_screenshot_(?P<taken>\d{8}_\d{6})\.(png|jpg|webp)$")
+
+
+class VerificationLog:
+    def __init__(self, directory=DEFAULT_SCREENSHOTS_DIR):
+        self.directory = Path(directory)
+        self.path = self.directory / LOG_FILE
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.entries = []  # every live entry, oldest first
+        self.by_user = defaultdict(list)  # user id -> entries, oldest first
+        self.outcomes = Counter()
+        self._times = []  # timestamps of ``entries``, for bisecting
+        self._offset = 0
+        self._seen = None  # (inode, size) of the log at the last refresh
+
+    def refresh(self):
+        """Apply log lines written since the last refresh, by any process."""
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            stat = None
+        seen = (stat.st_ino, stat.st_size) if stat else None
+        with self._lock:
+            if seen == self._seen:
+                return self
+            if stat is None or (self._seen and (stat.st_ino != self._seen[0] or stat.st_size < self._offset)):
+                self._reset()
+            if stat is not None:
+                for self._offset, entry in read_index(self.path, self._offset):
+                    if entry is None:
+                        continue
+                    if entry.get("deleted"):
+                        self._forget(entry["user_id"])
+                    else:
+                        self._add(entry)
+            self._seen = seen
+        return self
+
+    def _add(self, entry):
+        # Lines are appended in time order, except across concurrent writers
+        position = bisect.bisect_right(self._times, entry["timestamp"])
+        self._times.insert(position, entry["timestamp"])
+        self.entries.insert(position, entry)
+        if entry.get("user_id") is not None:
+            user_entries = self.by_user[entry["user_id"]]
+            user_entries.append(entry)
+            if len(user_entries) > 1 and user_entries[-2]["timestamp"] > entry["timestamp"]:
+                user_entries.sort(key=lambda e: e["timestamp"])
+        self.outcomes[entry["outcome"]] += 1
+
+    def _forget(self, user_id):
+        removed = self.by_user.pop(user_id, [])
+        if not removed:
+            return
+        for entry in removed:
+            self.outcomes[entry["outcome"]] -= 1
+        self.entries = [e for e in self.entries if e.get("user_id") != user_id]
+        self._times = [e["timestamp"] for e in self.entries]
+
+    def _write(self, entries):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        data = "".join(json.dumps(entry) + "\n" for entry in entries).encode("utf-8")
+        # One O_APPEND write per call keeps lines from different processes whole
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+    def append(self, user_id, name, outcome, stage_ms=None, screenshot=None, timestamp=None):
+        """Log one verification; ``screenshot`` is a path inside the screenshots directory."""
+        if outcome not in OUTCOMES:
+            raise ValueError(f"Unknown verification outcome {outcome!r}")
+        entry = {"user_id": user_id, "name": name,
+                 "timestamp": time.time() if timestamp is None else timestamp,
+                 "outcome": outcome,
+                 "stage_ms": {stage: round(ms, 2) for stage, ms in (stage_ms or {}).items()},
+                 "screenshot": Path(screenshot).name if screenshot else None}
+        self._write([entry])
+        return entry
+
+    def forget(self, user_id):
+        """Tombstone every entry of ``user_id``; screenshot files are left to the caller."""
+        self._write([{"user_id": user_id, "deleted": True}])
+
+    def count(self, outcome=None):
+        with self._lock:
+            return len(self.entries) if outcome is None else self.outcomes[outcome]
+
+    def count_since(self, timestamp):
+        with self._lock:
+            return len(self._times) - bisect.bisect_left(self._times, timestamp)
+
+    def recent(self, user_id, limit=5, outcome=None):
+        """The user's latest entries, newest first."""
+        with self._lock:
+            entries = self.by_user.get(user_id, [])
+            if outcome is None:
+                return entries[-limit:][::-1]
+            return [e for e in reversed(entries) if e["outcome"] == outcome][:limit]
+
+    def screenshots(self, user_id):
+        """Paths of every screenshot logged for ``user_id``."""
+        with self._lock:
+            return [self.directory / e["screenshot"] for e in self.by_user.get(user_id, [])
+                    if e["screenshot"]]
+
+    def screenshot_path(self, entry):
+        return self.directory / entry["screenshot"] if entry.get("screenshot") else None
+
+
+def backfill(log, registered):
+    """Log screenshots that predate the log; ``registered`` is {user id: name}."""
+    logged = {e["screenshot"] for e in log.refresh().entries}
+    first_names = defaultdict(list)
+    for user_id, name in registered.items():
+        first_names[name.split(" ")[0]].append((user_id, name))
+    entries = []
+    for screenshot in sorted(log.directory.glob("*_screenshot_*")):
+        match = _LEGACY_SCREENSHOT.match(screenshot.name)
+        if not match or screenshot.name in logged:
+            continue
+        # An ambiguous first name is logged without a user id
+        users = first_names.get(match["first_name"], [])
+        user_id, name = users[0] if len(users) == 1 else (None, match["first_name"])
+        taken = time.mktime(time.strptime(match["taken"], "%Y%m%d_%H%M%S"))
+        entries.append({"user_id": user_id, "name": name, "timestamp": taken, "outcome": "success",
+                        "stage_ms": {}, "screenshot": screenshot.name})
+    if entries:
+        log._write(entries)
+    return len(entries)
+
+
+_logs = {}
+_logs_lock = threading.Lock()
+
+
+def get_verification_log(directory=DEFAULT_SCREENSHOTS_DIR):
+    """The process-wide, freshly refreshed VerificationLog for ``directory``."""
+    key = Path(directory).resolve()
+    with _logs_lock:
+        if key not in _logs:
+            _logs[key] = VerificationLog(key)
+        log = _logs[key]
+    return log.refresh()
+
+
+def main(argv=None):
+    from utils.user_index import get_user_index
+
+    parser = argparse.ArgumentParser(description="Maintain the verification log.")
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--screenshots-dir", default=str(DEFAULT_SCREENSHOTS_DIR))
+    parser.add_argument("--faces-dir", default=str(ROOT_DIR / "faces"))
+    args = parser.parse_args(argv)
+
+    registered = {user["id"]: user["name"] for user in get_user_index(args.faces_dir).users()}
+    log = VerificationLog(args.screenshots_dir)
+    added = backfill(log, registered)
+    print(f"backfill: logged {added} screenshots; {log.refresh().count()} entries in {log.path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())